@@ -0,0 +1,47 @@
+"""add config change notifications
+
+Revision ID: 42a596db7d90
+Revises: 8e6645912f0f
+Create Date: 2026-10-18 11:07:44.402153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "42a596db7d90"
+down_revision = "8e6645912f0f"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        create or replace function notify_config_changed() returns trigger as $$
+        begin
+            if tg_op = 'DELETE' then
+                perform pg_notify('config_changed', old.guild_id::text);
+            else
+                perform pg_notify('config_changed', new.guild_id::text);
+            end if;
+
+            return null;
+        end;
+        $$ language plpgsql
+        """
+    )
+
+    op.execute(
+        """
+        create trigger config_changed
+        after insert or update or delete on config
+        for each row execute function notify_config_changed()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("drop trigger config_changed on config")
+    op.execute("drop function notify_config_changed")
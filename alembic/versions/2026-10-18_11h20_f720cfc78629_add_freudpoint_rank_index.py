@@ -0,0 +1,35 @@
+"""add freudpoint rank index
+
+Revision ID: f720cfc78629
+Revises: 42a596db7d90
+Create Date: 2026-10-18 11:20:12.583120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f720cfc78629"
+down_revision = "42a596db7d90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_profilestat_guildid_freudpoints",
+            "profile_statistics",
+            ["config_guild_id", sa.text("freudpoints DESC")],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_profilestat_guildid_freudpoints",
+            "profile_statistics",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,49 @@
+"""add leaderboard and verification indexes
+
+Revision ID: 22edb60371a3
+Revises: f720cfc78629
+Create Date: 2026-10-18 11:31:40.118842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "22edb60371a3"
+down_revision = "f720cfc78629"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_profilestat_guildid_exposedcount",
+            "profile_statistics",
+            ["config_guild_id", sa.text("confession_exposed_count DESC")],
+            postgresql_concurrently=True,
+        )
+
+        op.create_index(
+            "ix_profile_verified",
+            "profile",
+            ["discord_id"],
+            postgresql_where=sa.text("confirmation_code IS NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_profile_verified",
+            "profile",
+            postgresql_concurrently=True,
+        )
+
+        op.drop_index(
+            "ix_profilestat_guildid_exposedcount",
+            "profile_statistics",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,46 @@
+"""accrue spendable freudpoints lazily
+
+Revision ID: a57a11c5c0e9
+Revises: 22edb60371a3
+Create Date: 2026-10-18 11:52:06.740315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a57a11c5c0e9"
+down_revision = "22edb60371a3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "profile_statistics",
+        sa.Column(
+            "last_accrued_on",
+            sa.Date,
+            nullable=False,
+            server_default=sa.text("(now() at time zone 'utc')::date"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    # Materialize everything that accrued since the last spend
+    op.execute(
+        """
+        update profile_statistics s
+        set spendable_freudpoints = least(
+            s.spendable_freudpoints + ((now() at time zone 'utc')::date - s.last_accrued_on),
+            c.max_spendable_freudpoints
+        )
+        from config c
+        where c.guild_id = s.config_guild_id
+            and s.last_accrued_on < (now() at time zone 'utc')::date
+        """
+    )
+
+    op.drop_column("profile_statistics", "last_accrued_on")
@@ -0,0 +1,82 @@
+"""move crushes to edge table
+
+Revision ID: ee46f37d5794
+Revises: a57a11c5c0e9
+Create Date: 2026-10-18 12:05:19.604127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "ee46f37d5794"
+down_revision = "a57a11c5c0e9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "crush",
+        sa.Column(
+            "from_id",
+            sa.BigInteger,
+            sa.ForeignKey("profile.discord_id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "to_id",
+            sa.BigInteger,
+            sa.ForeignKey("profile.discord_id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+
+    op.create_primary_key("pk_crush_fromid_toid", "crush", ["from_id", "to_id"])
+    op.create_index("ix_crush_toid_fromid", "crush", ["to_id", "from_id"])
+
+    # Crushes on profiles that have since been deleted are dropped
+    op.execute(
+        """
+        insert into crush (from_id, to_id)
+        select p.discord_id, c.to_id
+        from profile p
+        cross join lateral unnest(p.crushes) as c(to_id)
+        join profile t on t.discord_id = c.to_id
+        on conflict do nothing
+        """
+    )
+
+    op.drop_column("profile", "crushes")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "profile",
+        sa.Column(
+            "crushes", sa.ARRAY(sa.BigInteger), nullable=False, server_default="{}"
+        ),
+    )
+
+    op.execute(
+        """
+        update profile p
+        set crushes = c.crushes
+        from (
+            select from_id, array_agg(to_id order by created_at) as crushes
+            from crush
+            group by from_id
+        ) c
+        where c.from_id = p.discord_id
+        """
+    )
+
+    op.drop_index("ix_crush_toid_fromid", "crush")
+    op.drop_table("crush")
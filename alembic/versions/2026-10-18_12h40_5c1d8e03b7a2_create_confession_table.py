@@ -0,0 +1,69 @@
+"""create confession table
+
+Revision ID: 5c1d8e03b7a2
+Revises: ee46f37d5794
+Create Date: 2026-10-18 12:40:27.318904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5c1d8e03b7a2"
+down_revision = "ee46f37d5794"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("confession_id_seq")))
+
+    op.create_table(
+        "confession",
+        sa.Column(
+            "id",
+            sa.BigInteger,
+            sa.Sequence("confession_id_seq"),
+            primary_key=True,
+            server_default=sa.text("nextval('confession_id_seq')"),
+        ),
+        sa.Column(
+            "guild_id",
+            sa.BigInteger,
+            sa.ForeignKey("config.guild_id", ondelete="CASCADE"),
+            nullable=False,
+        ),
+        sa.Column("message_id", sa.BigInteger, nullable=False),
+        sa.Column("thread_id", sa.BigInteger),
+        sa.Column(
+            "parent_id",
+            sa.BigInteger,
+            sa.ForeignKey("confession.id", ondelete="CASCADE"),
+        ),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+        sa.UniqueConstraint("message_id", name="unique_confession_message_id"),
+    )
+
+    op.execute("alter sequence confession_id_seq owned by confession.id")
+
+    op.create_index(
+        "ix_confession_guildid_createdat", "confession", ["guild_id", "created_at"]
+    )
+    op.create_index(
+        "ix_confession_parentid",
+        "confession",
+        ["parent_id"],
+        postgresql_where=sa.text("parent_id is not null"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_confession_parentid", "confession")
+    op.drop_index("ix_confession_guildid_createdat", "confession")
+    op.drop_table("confession")
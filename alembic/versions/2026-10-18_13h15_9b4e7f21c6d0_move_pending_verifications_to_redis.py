@@ -0,0 +1,131 @@
+"""move pending verifications to redis
+
+Revision ID: 9b4e7f21c6d0
+Revises: 5c1d8e03b7a2
+Create Date: 2026-10-18 13:15:42.781305
+
+"""
+import logging
+import os
+
+from alembic import context, op
+import sqlalchemy as sa
+import redis
+
+
+# revision identifiers, used by Alembic.
+revision = "9b4e7f21c6d0"
+down_revision = "5c1d8e03b7a2"
+branch_labels = None
+depends_on = None
+
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Must match bot.verification_codes.VerificationCodes
+PENDING_VERIFICATION_TTL = 86400
+
+
+def upgrade() -> None:
+    if context.is_offline_mode():
+        # The codes have to be read to copy them to redis
+        raise RuntimeError(
+            "moving pending verifications to redis can't be done in offline mode"
+        )
+
+    pending = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "select discord_id, email, confirmation_code from profile where confirmation_code is not null"
+            )
+        )
+        .all()
+    )
+
+    if pending:
+        if "CH_URL" not in os.environ:
+            raise RuntimeError(
+                f"{len(pending)} pending verifications have to be moved to redis, set CH_URL to the cache to migrate"
+            )
+
+        cache = redis.Redis.from_url(os.environ["CH_URL"], decode_responses=True)
+
+        with cache.pipeline(transaction=False) as pipe:
+            for discord_id, email, code in pending:
+                key = f"verification:{discord_id}"
+                pipe.hset(key, mapping={"email": email, "code": code, "attempts": 0})
+                pipe.expire(key, PENDING_VERIFICATION_TTL)
+
+            pipe.execute()
+
+        cache.close()
+
+        logger.info(f"moved {len(pending)} pending verifications to redis")
+
+    # The statistics and crushes of pending profiles are set aside until they
+    # verify, see Profile.create_verified
+    op.execute(
+        "create table pending_profile_statistics (like profile_statistics including defaults)"
+    )
+    op.execute(
+        """
+        insert into pending_profile_statistics
+        select profile_statistics.*
+        from profile_statistics
+        join profile on profile.discord_id = profile_statistics.profile_discord_id
+        where profile.confirmation_code is not null
+        """
+    )
+    op.create_index(
+        "ix_pending_profile_statistics_profile_discord_id",
+        "pending_profile_statistics",
+        ["profile_discord_id"],
+    )
+
+    op.execute("create table pending_crush (like crush including defaults)")
+    op.execute(
+        """
+        insert into pending_crush
+        select crush.*
+        from crush
+        where exists (
+            select from profile
+            where profile.discord_id in (crush.from_id, crush.to_id)
+                and profile.confirmation_code is not null
+        )
+        """
+    )
+    op.create_index("ix_pending_crush_from_id", "pending_crush", ["from_id"])
+    op.create_index("ix_pending_crush_to_id", "pending_crush", ["to_id"])
+
+    # Profiles only exist once they are verified from now on
+    op.execute(
+        """
+        delete from profile_statistics
+        using profile
+        where profile.discord_id = profile_statistics.profile_discord_id
+            and profile.confirmation_code is not null
+        """
+    )
+    op.execute("delete from profile where confirmation_code is not null")
+
+    # Also drops ix_profile_verified
+    op.drop_column("profile", "confirmation_code")
+
+
+def downgrade() -> None:
+    # Codes that are pending in redis are not moved back, those users will
+    # have to request a new one. The statistics and crushes that were set
+    # aside for them are dropped with their tables.
+    op.drop_table("pending_crush")
+    op.drop_table("pending_profile_statistics")
+
+    op.add_column("profile", sa.Column("confirmation_code", sa.Text, unique=True))
+
+    op.create_index(
+        "ix_profile_verified",
+        "profile",
+        ["discord_id"],
+        postgresql_where=sa.text("confirmation_code IS NULL"),
+    )
@@ -0,0 +1,54 @@
+-- Benchmark for the leaderboard indexes
+--
+-- Seeds a large dataset, prints the query plans of the hot path queries
+-- without and with the indexes, and rolls everything back afterwards.
+-- Only run this against a development database (`make bench`), dropping the
+-- indexes locks the tables until the transaction ends.
+
+\timing on
+
+begin;
+
+-- 10 guilds, 200k profiles, every profile has statistics in 3 guilds
+insert into config (guild_id)
+select g from generate_series(9000000000, 9000000009) g;
+
+insert into profile (discord_id, email)
+select p, 'bench' || p || '@ugent.be'
+from generate_series(9100000000, 9100199999) p;
+
+insert into profile_statistics
+	(profile_discord_id, config_guild_id, freudpoints, confession_exposed_count)
+select
+	p,
+	9000000000 + (p + g) % 10,
+	(random() * 1000)::int,
+	(random() * 20)::int
+from generate_series(9100000000, 9100199999) p, generate_series(0, 2) g;
+
+analyze config;
+analyze profile;
+analyze profile_statistics;
+
+\echo
+\echo '======== without indexes ========'
+
+drop index if exists ix_profilestat_guildid_freudpoints;
+drop index if exists ix_profilestat_guildid_exposedcount;
+
+\ir benchmark_queries.sql
+
+\echo
+\echo '======== with indexes ========'
+
+create index ix_profilestat_guildid_freudpoints
+	on profile_statistics (config_guild_id, freudpoints desc);
+create index ix_profilestat_guildid_exposedcount
+	on profile_statistics (config_guild_id, confession_exposed_count desc);
+
+analyze profile;
+analyze profile_statistics;
+
+\ir benchmark_queries.sql
+
+rollback;
@@ -0,0 +1,147 @@
+"""
+Benchmark for sending verification mail
+
+Runs a local SMTP stand-in that takes a while to accept every message, and
+measures how long the event loop stalls while a burst of mail is sent. Mail
+is sent once with blocking smtplib calls on the event loop, the way
+verification mail used to be sent, and once through `MailTransport`.
+
+Run it with `make bench-mail`, no containers are needed.
+"""
+
+import argparse
+import asyncio
+import smtplib
+import socketserver
+import threading
+import time
+
+from bot.mail import MailTransport
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib to send a message"""
+
+    latency = 0.1
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 localhost stand-in")
+
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250 localhost")
+            elif command.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+
+                # A real server takes its time to accept a message
+                time.sleep(self.latency)
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+async def measure_stalls(done: asyncio.Event, interval: float = 0.005) -> list[float]:
+    """Record how much later than expected the event loop wakes up"""
+
+    stalls = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+    return stalls
+
+
+def send_blocking(host: str, port: int, to: str, message: str):
+    server = smtplib.SMTP(host, port)
+    server.ehlo()
+    server.sendmail("bench@localhost", to, message)
+    server.quit()
+
+
+async def run(name: str, send, count: int):
+    done = asyncio.Event()
+    stalls_task = asyncio.create_task(measure_stalls(done))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await send(count)
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    stalls = await stalls_task
+
+    print(
+        f"{name:>10}: {count} mails in {elapsed:.2f}s, "
+        f"event loop stalled {max(stalls) * 1000:.0f}ms at most, "
+        f"{sum(stalls) / len(stalls) * 1000:.1f}ms on average"
+    )
+
+
+async def main(count: int, latency: float, pool_size: int):
+    SmtpHandler.latency = latency
+
+    server = SmtpServer(("127.0.0.1", 0), SmtpHandler)
+    host, port = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    message = "From: bench@localhost\nTo: {to}\nSubject: bench\n\nCode: 1234"
+
+    async def blocking(count: int):
+        for i in range(count):
+            to = f"user{i}@ugent.be"
+            send_blocking(host, port, to, message.format(to=to))
+
+            # Every mail used to be sent from its own interaction, other
+            # events could be handled in between
+            await asyncio.sleep(0.001)
+
+    transport = MailTransport(host, port, pool_size=pool_size, starttls=False)
+
+    async def pooled(count: int):
+        await asyncio.gather(
+            *(
+                transport.send(
+                    "bench@localhost",
+                    "",
+                    f"user{i}@ugent.be",
+                    message.format(to=f"user{i}@ugent.be"),
+                )
+                for i in range(count)
+            )
+        )
+
+    print(f"sending {count} mails, the server takes {latency * 1000:.0f}ms per mail")
+
+    await run("blocking", blocking, count)
+    await run("pooled", pooled, count)
+
+    await transport.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.count, args.latency, args.pool_size))
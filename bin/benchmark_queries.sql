@@ -0,0 +1,31 @@
+-- Hot path queries used by bin/benchmark_indexes.sql
+--
+-- Top 10s and ranks are read from the Redis leaderboards, Postgres is only
+-- asked for a guild's scores when a leaderboard is (re)built or checked for
+-- drift
+
+\echo
+\echo '-------- FreudPoint scores in guild --------'
+explain analyze
+select profile_discord_id, freudpoints from profile_statistics
+where config_guild_id = 9000000003;
+
+\echo
+\echo '-------- exposed scores in guild --------'
+explain analyze
+select profile_discord_id, confession_exposed_count from profile_statistics
+where config_guild_id = 9000000003;
+
+\echo
+\echo '-------- profile card --------'
+explain analyze
+select * from profile_statistics
+where profile_discord_id = 9100000042 and config_guild_id = 9000000003;
+
+\echo
+\echo '-------- verified members of guild --------'
+explain analyze
+select discord_id from profile
+where discord_id = any(array(
+	select generate_series(9100000000::bigint, 9100004999::bigint)
+));
@@ -12,7 +12,15 @@ from discord.ext import commands
 from discord.utils import MISSING
 import redis.asyncio as redis
 
+from models.config import cache as config_cache
+
+from bot.leaderboard import Leaderboard
 from bot.log.guild_adapter import GuildAdapter
+from bot.mail import MailTransport
+from bot.mail_queue import MailQueue
+from bot.role_grants import RoleExecutor
+from bot.role_sync import RoleSync
+from bot.verification_codes import VerificationCodes
 
 
 logger = logging.getLogger("bot")
@@ -31,6 +39,22 @@ class Bot(commands.Bot):
         self.redis = redis.Redis.from_url(os.environ["CH_URL"], decode_responses=True)
         logger.info("cache connected")
 
+        self.freudpoint_leaderboard = Leaderboard(
+            self.redis, "freudpoints", "freudpoints"
+        )
+        self.exposed_leaderboard = Leaderboard(
+            self.redis, "exposed", "confession_exposed_count"
+        )
+        self.leaderboards = [self.freudpoint_leaderboard, self.exposed_leaderboard]
+
+        self.mail = MailTransport()
+        self.mail_queue = MailQueue(self.redis, self.mail)
+
+        self.role_executor = RoleExecutor()
+        self.role_sync = RoleSync(self.redis, self.role_executor)
+
+        self.verification_codes = VerificationCodes(self.redis)
+
     @classmethod
     async def create(cls) -> "Bot":
         """Create and return a new bot instance"""
@@ -120,6 +144,12 @@ class Bot(commands.Bot):
         await self.redis.aclose()
         logger.info("cache closed")
 
+        await config_cache.stop()
+        logger.info("config listener closed")
+
+        await self.mail.close()
+        logger.info("mail connections closed")
+
         await self.db.dispose()
         logger.info("database closed")
 
@@ -8,6 +8,27 @@ DRIVE_LINKS = {
     "Nuttige Info": "https://drive.google.com/drive/folders/1L6ne7AACpmJSmz8fzYGWe5t8sK8j06NI?usp=sharing",
 }
 
+
+class Messages:
+    """Replies that aren't configurable per guild"""
+
+    VERIFICATION_EXPIRED = (
+        "Your verification code expired, use '/verify' to get a new one"
+    )
+    TOO_MANY_ATTEMPTS = (
+        "You entered too many invalid codes, use '/verify' to get a new one"
+    )
+
+
+class LogMessages:
+    """Messages logged to the guild log channels, formatted with `str.format`"""
+
+    NO_PENDING_VERIFICATION = "user {user} attempted to verify with code '{code}', but has no pending verification"
+    TOO_MANY_ATTEMPTS = (
+        "user {user} entered too many invalid codes, their code was thrown away"
+    )
+
+
 FREUD_QUOTES = [
     "One day, in retrospect, the years of struggle will strike you as the most beautiful.",
     "Being entirely honest with oneself is a good exercise.",
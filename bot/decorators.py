@@ -1,8 +1,9 @@
-import discord
 from discord import (
     Interaction,
+    Role,
     app_commands,
 )
+from discord.abc import GuildChannel
 from discord.app_commands.errors import MissingRole
 
 from models.config import Config
@@ -10,94 +11,117 @@ from models.config import Config
 from bot.exceptions import MissingConfig, MissingConfigOption, WrongChannel
 
 
-def check_user_has_admin_role() -> bool:
+class Requirements:
     """
-    Check if the user calling the command has the corresponding admin role in
-    their guild
+    The resolved requirements of a command
+
+    Available to the command body through `get_requirements` once the
+    precondition created by `requires` has passed
     """
 
-    async def predicate(ia: Interaction) -> bool:
-        guild_config = await Config.get(ia.guild_id)
-        if guild_config is None:
-            raise MissingConfig(ia.guild)
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self.roles: dict[str, Role | None] = {}
+        self.channels: dict[str, GuildChannel | None] = {}
 
-        if guild_config.admin_role is None:
-            raise MissingConfigOption(ia.guild, "admin_role")
 
-        admin_role = discord.utils.get(ia.guild.roles, id=guild_config.admin_role)
+def get_requirements(ia: Interaction) -> Requirements:
+    """Get the requirements resolved for the command being run"""
 
-        if ia.user.get_role(admin_role.id) is None:
-            raise MissingRole(admin_role)
+    return ia.extras["requirements"]
 
-        return True
 
-    return app_commands.check(predicate)
+def requires(
+    *options: str,
+    admin: bool = False,
+    verified: bool = False,
+    channel: str | None = None,
+) -> bool:
+    """
+    Check all of a commands requirements in a single pass
 
+    Every given config option must be set, options ending in `_role` or
+    `_channel` are resolved to their role or channel. If `admin` or `verified`
+    is set the user must have the corresponding role, and if `channel` is set
+    the command can only be used in the channel stored in that config option.
+    """
 
-def check_user_is_verified() -> bool:
-    """Check if the user calling the command is verified or not"""
+    options = list(dict.fromkeys(options))
+    member_roles = []
+    if admin:
+        member_roles.append("admin_role")
+    if verified:
+        member_roles.append("verified_role")
+
+    for option in [*member_roles, channel]:
+        if option is not None and option not in options:
+            options.append(option)
 
     async def predicate(ia: Interaction) -> bool:
         guild_config = await Config.get(ia.guild_id)
         if guild_config is None:
             raise MissingConfig(ia.guild)
 
-        if guild_config.verified_role is None:
-            raise MissingConfigOption(ia.guild, "verified_role")
+        requirements = Requirements(guild_config)
+
+        for option in options:
+            value = getattr(guild_config, option)
+            if value is None:
+                raise MissingConfigOption(ia.guild, option)
+
+            if option.endswith("_role"):
+                requirements.roles[option] = ia.guild.get_role(value)
+            elif option.endswith("_channel"):
+                requirements.channels[option] = ia.guild.get_channel(value)
 
-        verified_role = discord.utils.get(ia.guild.roles, id=guild_config.verified_role)
+        for option in member_roles:
+            role = requirements.roles[option]
+            if role is None or ia.user.get_role(role.id) is None:
+                raise MissingRole(role or getattr(guild_config, option))
 
-        if ia.user.get_role(verified_role.id) is None:
-            raise MissingRole(verified_role)
+        if channel is not None:
+            allowed_channel = requirements.channels[channel]
+            if allowed_channel is None or ia.channel_id != allowed_channel.id:
+                raise WrongChannel(
+                    ia.guild, ia.user, ia.command, ia.channel, allowed_channel
+                )
+
+        ia.extras["requirements"] = requirements
 
         return True
 
     return app_commands.check(predicate)
 
 
-def check_has_config_option(option: str) -> bool:
+def check_user_has_admin_role() -> bool:
     """
-    Check if the guild this command is called in has a given config option set
-    or not
+    Check if the user calling the command has the corresponding admin role in
+    their guild
     """
 
-    async def predicate(ia: Interaction) -> bool:
-        guild_config = await Config.get(ia.guild_id)
-        if guild_config is None:
-            raise MissingConfig(ia.guild)
+    return requires(admin=True)
 
-        if getattr(guild_config, option) is None:
-            raise MissingConfigOption(ia.guild, option)
 
-        return True
+def check_user_is_verified() -> bool:
+    """Check if the user calling the command is verified or not"""
 
-    return app_commands.check(predicate)
+    return requires(verified=True)
 
 
-def only_in_channel(channel_option: str) -> bool:
+def check_has_config_option(option: str) -> bool:
     """
-    Ensure the command can only be used in the specified channel
-
-    The argument must be the name of a config option
+    Check if the guild this command is called in has a given config option set
+    or not
     """
 
-    async def predicate(ia: Interaction) -> bool:
-        guild_config = await Config.get(ia.guild_id)
-        if guild_config is None:
-            raise MissingConfig(ia.guild)
-
-        if getattr(guild_config, channel_option) is None:
-            raise MissingConfigOption(ia.guild, channel_option)
+    return requires(option)
 
-        allowed_channel = discord.utils.get(
-            ia.guild.text_channels, id=getattr(guild_config, channel_option)
-        )
 
-        if ia.channel_id != allowed_channel.id:
-            raise WrongChannel(
-                ia.guild, ia.user, ia.command, ia.channel, allowed_channel
-            )
+def only_in_channel(channel_option: str) -> bool:
+    """
+    Ensure the command can only be used in the specified channel
 
-        return True
+    The argument must be the name of a config option
+    """
 
-    return app_commands.check(predicate)
+    return requires(channel=channel_option)
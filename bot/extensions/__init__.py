@@ -10,6 +10,8 @@ from discord import HTTPException as http_errors
 from discord.app_commands import AppCommandError, errors as app_errors
 from discord.ext.commands import Context, CommandError, Cog, errors as cmd_errors
 
+from models.profile import use_profile_loader
+
 from bot import extensions, root_logger, exceptions as bot_errors
 from bot.bot import Bot
 from bot.events import Event
@@ -24,6 +26,13 @@ class ErrorHandledCog(Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
 
+    async def interaction_check(self, ia: Interaction) -> bool:
+        # Runs in the interaction's own task, before any of the command's
+        # checks, so all of its profile lookups share one loader
+        use_profile_loader()
+
+        return True
+
     @staticmethod
     def app_error_to_event(ia: Interaction, error: AppCommandError) -> Event:
         """Map an app command error and its interaction to a loggable event"""
@@ -1,6 +1,7 @@
 import random
 from enum import Enum
 import logging
+import re
 
 import discord
 from discord import (
@@ -12,17 +13,15 @@ from discord import (
     Colour,
     Member,
 )
-from discord.ui import View, Button
-from redis.asyncio import Redis
+from discord.ui import DynamicItem, View, Button
 
 from models.config import Config
+from models.confession import Confession
 from models.profile_statistics import ProfileStatistics
 
 from bot.bot import Bot
-from bot.decorators import (
-    check_has_config_option,
-    check_user_is_verified,
-)
+from bot.decorators import get_requirements, requires
+from bot.exceptions import MissingConfig, MissingConfigOption
 from bot.extensions import ErrorHandledCog
 
 
@@ -55,23 +54,19 @@ class ConfessionType(Enum):
         return self.value[2]
 
 
-class Confession:
+class PendingConfession:
     def __init__(
         self,
         confession: str,
         poster: Member,
         type_: ConfessionType,
-        reply: str | None,
-        redis: Redis,
-        confession_channel: TextChannel,
+        reply: int | None,
         approval_channel: TextChannel,
     ):
         self.confession = confession
         self.poster = poster
         self.type_ = type_
         self.reply = reply
-        self.redis = redis
-        self.confession_channel = confession_channel
         self.approval_channel = approval_channel
 
     async def send_pending(self):
@@ -84,91 +79,158 @@ class Confession:
         if self.reply is not None:
             pending_embed.set_author(name=f"Reply to #{self.reply}")
 
-        pending_view = PendingApprovalView(
-            redis=self.redis,
-            confession=pending_embed,
-            reply=self.reply,
-            confession_channel=self.confession_channel,
-            poster=self.poster,
-            chance=self.type_.chance,
+        await self.approval_channel.send(
+            embed=pending_embed,
+            view=approval_view(self.type_, self.poster.id, self.reply),
         )
 
-        pending_view.message = await self.approval_channel.send(
-            embed=pending_embed,
-            view=pending_view,
+
+def approval_view(
+    type_: ConfessionType,
+    poster_id: int,
+    reply: int | None,
+    disabled: bool = False,
+) -> View:
+    """Create the approve and reject buttons of a pending confession"""
+
+    view = View(timeout=None)
+    for action in ("approve", "reject"):
+        view.add_item(
+            ApprovalButton(action, type_, poster_id, reply, disabled=disabled)
         )
 
+    return view
+
+
+class ApprovalButton(
+    DynamicItem[Button],
+    template=r"confess:(?P<action>approve|reject):(?P<type>[a-z]+):(?P<poster_id>[0-9]+)(?::(?P<reply>[0-9]+))?",
+):
+    """
+    Approves or rejects a pending confession
+
+    Everything but the confession itself is kept in the custom_id, the
+    confession is read back from the pending message. This way buttons keep
+    working after a restart without having to hold on to their views.
+    """
 
-class PendingApprovalView(View):
     def __init__(
         self,
-        redis: Redis,
-        confession: Embed,
-        reply: str | None,
-        confession_channel: TextChannel,
-        poster: Member,
-        chance: float | None,
-    ):
-        super().__init__(timeout=None)
-        self.redis = redis
-        self.confession = confession
+        action: str,
+        type_: ConfessionType,
+        poster_id: int,
+        reply: int | None,
+        disabled: bool = False,
+    ) -> None:
+        self.action = action
+        self.type_ = type_
+        self.poster_id = poster_id
         self.reply = reply
-        self.confession_channel = confession_channel
-        self.poster = poster
-        self.chance = chance
 
-    @discord.ui.button(label="✓", style=ButtonStyle.green)
-    async def approve(self, ia: Interaction, _btn: Button):
-        for item in self.children:
-            item.disabled = True
+        custom_id = f"confess:{action}:{type_.name.lower()}:{poster_id}"
+        if reply is not None:
+            custom_id += f":{reply}"
+
+        super().__init__(
+            Button(
+                label="✓" if action == "approve" else "⨯",
+                style=ButtonStyle.green if action == "approve" else ButtonStyle.red,
+                custom_id=custom_id,
+                disabled=disabled,
+            )
+        )
+
+    @classmethod
+    async def from_custom_id(
+        cls, ia: Interaction, item: Button, match: re.Match[str]
+    ) -> "ApprovalButton":
+        return cls(
+            match["action"],
+            ConfessionType[match["type"].upper()],
+            int(match["poster_id"]),
+            None if match["reply"] is None else int(match["reply"]),
+        )
 
-        confession_id = await self.redis.incr("confessionid")
+    async def callback(self, ia: Interaction):
+        if self.action == "approve":
+            await self.approve(ia)
+        else:
+            await self.reject(ia)
 
-        self.confession.colour = Colour.from_str("#3fc03f")
-        self.confession.title = f"{self.confession.title} (#{confession_id})"
+    async def approve(self, ia: Interaction):
+        guild_config = await Config.get(ia.guild_id)
+        if guild_config is None:
+            raise MissingConfig(ia.guild)
 
-        await self.message.edit(embed=self.confession, view=self)
-        await ia.response.defer()
+        confession_channel = ia.guild.get_channel(guild_config.confession_channel)
+        if confession_channel is None:
+            raise MissingConfigOption(ia.guild, "confession_channel")
 
-        actual_confession = self.confession.copy()
+        confession_id, parent = await Confession.allocate(self.reply)
 
-        actual_confession.colour = Colour.random()
+        confession = ia.message.embeds[0]
+        confession.colour = Colour.from_str("#3fc03f")
+        confession.title = f"{confession.title} (#{confession_id})"
 
-        if self.chance is not None and random.random() <= self.chance:
-            await ProfileStatistics.increment_exposed_count(self.poster.id, ia.guild_id)
+        await ia.response.edit_message(
+            embed=confession,
+            view=approval_view(self.type_, self.poster_id, self.reply, disabled=True),
+        )
 
-            actual_confession.add_field(name="Sent By", value=self.poster.mention)
+        actual_confession = confession.copy()
 
-        if self.reply is not None:
-            reply_msg_id = int(await self.redis.get(f"confession:{self.reply}"))
-            reply_msg = self.confession_channel.get_partial_message(reply_msg_id)
+        actual_confession.colour = Colour.random()
+
+        chance = self.type_.chance
+        if chance is not None and random.random() <= chance:
+            await ProfileStatistics.increment_exposed_count(self.poster_id, ia.guild_id)
+            await ia.client.exposed_leaderboard.increment(
+                ia.guild_id, self.poster_id, 1
+            )
 
-            try:
-                thread = await reply_msg.create_thread(
-                    name="confession", reason="confession reply"
+            actual_confession.add_field(name="Sent By", value=f"<@{self.poster_id}>")
+
+        if parent is not None:
+            if parent.thread_id is not None:
+                thread = ia.client.get_partial_messageable(
+                    parent.thread_id, guild_id=ia.guild_id
                 )
-            except discord.errors.HTTPException as err:
-                if err.code == 160004:
-                    thread = self.confession_channel.get_thread(reply_msg_id)
-                else:
-                    raise err
+            else:
+                reply_msg = confession_channel.get_partial_message(parent.message_id)
+
+                try:
+                    thread = await reply_msg.create_thread(
+                        name="confession", reason="confession reply"
+                    )
+                except discord.errors.HTTPException as err:
+                    # Another reply created the thread since the parent was
+                    # looked up
+                    if err.code == 160004:
+                        thread = confession_channel.get_thread(parent.message_id)
+                    else:
+                        raise err
+
+                await Confession.set_thread(parent.id, thread.id)
 
             actual_msg = await thread.send(embed=actual_confession)
         else:
-            actual_msg = await self.confession_channel.send(embed=actual_confession)
-
-        await self.redis.set(f"confession:{confession_id}", actual_msg.id)
-        await self.redis.expire(f"confession:{confession_id}", 86400)
+            actual_msg = await confession_channel.send(embed=actual_confession)
 
-    @discord.ui.button(label="⨯", style=ButtonStyle.red)
-    async def reject(self, ia: Interaction, _btn: Button):
-        for item in self.children:
-            item.disabled = True
+        await Confession.record(
+            confession_id,
+            ia.guild_id,
+            actual_msg.id,
+            parent_id=None if parent is None else parent.id,
+        )
 
-        self.confession.colour = Colour.from_str("#fb4934")
+    async def reject(self, ia: Interaction):
+        confession = ia.message.embeds[0]
+        confession.colour = Colour.from_str("#fb4934")
 
-        await self.message.edit(embed=self.confession, view=self)
-        await ia.response.defer()
+        await ia.response.edit_message(
+            embed=confession,
+            view=approval_view(self.type_, self.poster_id, self.reply, disabled=True),
+        )
 
 
 class Confess(ErrorHandledCog):
@@ -185,38 +247,32 @@ class Confess(ErrorHandledCog):
     ):
         await ia.response.defer(ephemeral=True, thinking=True)
 
-        config = await Config.get(ia.guild_id)
-        approval_channel = discord.utils.get(
-            ia.guild.channels, id=config.confession_approval_channel
-        )
-        confession_channel = discord.utils.get(
-            ia.guild.channels, id=config.confession_channel
-        )
+        requirements = get_requirements(ia)
+        approval_channel = requirements.channels["confession_approval_channel"]
 
+        reply_id = None
         if reply is not None:
-            reply_msg_id = await self.bot.redis.get(f"confession:{reply}")
-            if reply_msg_id is None:
+            parent = await Confession.find(int(reply)) if reply.isdecimal() else None
+            if parent is None or parent.guild_id != ia.guild_id:
                 await ia.followup.send(
                     f"{reply} is not a valid confession ID", ephemeral=True
                 )
                 return
 
-            try:
-                await confession_channel.fetch_message(int(reply_msg_id))
-            except discord.errors.HTTPException:
+            if parent.parent_id is not None:
                 await ia.followup.send(
                     f"{reply} is not a valid confession ID (keep in mind that you cannot reply to other replies)",
                     ephemeral=True,
                 )
                 return
 
-        confession_wrapper = Confession(
+            reply_id = parent.id
+
+        confession_wrapper = PendingConfession(
             confession=confession,
             poster=ia.user,
             type_=type_,
-            reply=reply,
-            redis=self.bot.redis,
-            confession_channel=confession_channel,
+            reply=reply_id,
             approval_channel=approval_channel,
         )
 
@@ -233,9 +289,7 @@ class Confess(ErrorHandledCog):
         confession="The confession you want to post",
         reply="The ID of the confession you want to reply to",
     )
-    @check_has_config_option("confession_approval_channel")
-    @check_has_config_option("confession_channel")
-    @check_user_is_verified()
+    @requires("confession_approval_channel", "confession_channel", verified=True)
     async def normal_confess(
         self, ia: Interaction, confession: str, reply: str | None = None
     ):
@@ -249,9 +303,7 @@ class Confess(ErrorHandledCog):
         confession="The confession you want to post",
         reply="The ID of the confession you want to reply to",
     )
-    @check_has_config_option("confession_approval_channel")
-    @check_has_config_option("confession_channel")
-    @check_user_is_verified()
+    @requires("confession_approval_channel", "confession_channel", verified=True)
     async def russian_confess(
         self, ia: Interaction, confession: str, reply: str | None = None
     ):
@@ -265,14 +317,13 @@ class Confess(ErrorHandledCog):
         confession="The confession you want to post",
         reply="The ID of the confession you want to reply to",
     )
-    @check_has_config_option("confession_approval_channel")
-    @check_has_config_option("confession_channel")
-    @check_user_is_verified()
-    async def russian_confess(
+    @requires("confession_approval_channel", "confession_channel", verified=True)
+    async def extreme_confess(
         self, ia: Interaction, confession: str, reply: str | None = None
     ):
         await self.confess_inner(ia, confession, ConfessionType.EXTREME, reply)
 
 
 async def setup(bot: Bot):
+    bot.add_dynamic_items(ApprovalButton)
     await bot.add_cog(Confess(bot))
@@ -1,37 +1,17 @@
-import time
 from discord import Member, app_commands, Interaction, Embed
 
 from bot.bot import Bot
 from bot.decorators import check_user_is_verified
 from bot.extensions import ErrorHandledCog
-from models.profile import Profile
+from bot.match_cooldown import MatchCooldown
+from models.crush import Crush
 
 
 class Freudr(ErrorHandledCog):
-    @staticmethod
-    def hash_match(user_id, crush_id) -> int:
-        if user_id <= crush_id:
-            return hash(f"{user_id}:{crush_id}")
+    def __init__(self, bot: Bot) -> None:
+        super().__init__(bot)
 
-        return hash(f"{crush_id}:{user_id}")
-
-    async def is_match_cached(self, user_id: int, crush_id: int) -> bool:
-        match_hash = self.hash_match(user_id, crush_id)
-
-        timestamp = int(time.time())
-        await self.bot.redis.zremrangebyscore("freudr_matches", 0, timestamp - 86400)
-
-        score = await self.bot.redis.zscore("freudr_matches", match_hash)
-
-        return score is not None
-
-    async def cache_match(self, user_id: int, crush_id: int):
-        match_hash = self.hash_match(user_id, crush_id)
-
-        timestamp = int(time.time())
-        await self.bot.redis.zremrangebyscore("freudr_matches", 0, timestamp - 86400)
-
-        await self.bot.redis.zadd("freudr_matches", {match_hash: timestamp}, nx=True)
+        self.match_cooldown = MatchCooldown(bot.redis)
 
     freudr_group = app_commands.Group(
         name="freudr", description="Freudr dating service commands", guild_only=True
@@ -43,44 +23,39 @@ class Freudr(ErrorHandledCog):
     @app_commands.describe()
     @check_user_is_verified()
     async def like(self, ia: Interaction, crush: Member):
-        crush_profile = await Profile.find_by_discord_id(crush.id)
-
-        if not crush_profile or not crush_profile.is_verified():
+        if crush.id == ia.user.id:
             return await ia.response.send_message(
-                f"{crush.mention} is not verified, freudr commands only work on verified members",
+                "Some recommended reading: https://en.wikipedia.org/wiki/Narcissistic_personality_disorder",
                 ephemeral=True,
             )
 
-        if crush.id == ia.user.id:
+        if await self.match_cooldown.is_cooling_down(ia.user.id, crush.id):
             return await ia.response.send_message(
-                "Some recommended reading: https://en.wikipedia.org/wiki/Narcissistic_personality_disorder",
+                f"Calm down there, you already matched with {crush.mention} in the last 24 hours",
                 ephemeral=True,
             )
 
-        profile = await Profile.find_by_discord_id(ia.user.id)
-
-        if crush.id in profile.crushes:
+        liked = await Crush.like(ia.user.id, crush.id)
+        if liked is None:
             return await ia.response.send_message(
-                f"{crush.mention} is already in your list of crushes. If you like them this much, maybe you should send them a DM yourself.",
+                f"{crush.mention} is not verified, freudr commands only work on verified members",
                 ephemeral=True,
             )
 
-        if await self.is_match_cached(ia.user.id, crush.id):
+        added, mutual = liked
+        if not added:
             return await ia.response.send_message(
-                f"Calm down there, you already matched with {crush.mention} in the last 24 hours",
+                f"{crush.mention} is already in your list of crushes. If you like them this much, maybe you should send them a DM yourself.",
                 ephemeral=True,
             )
 
-        profile.crushes.append(crush.id)
-        await profile.save()
-
         await ia.response.send_message(
             f"Added {crush.mention} to your list of crushes", ephemeral=True
         )
 
-        if ia.user.id in crush_profile.crushes:
-            await self.cache_match(ia.user.id, crush.id)
-
+        # Starting the cooldown only succeeds once, so a pair can't be
+        # congratulated twice
+        if mutual and await self.match_cooldown.start(ia.user.id, crush.id):
             user_dm_channel = ia.user.dm_channel
             if user_dm_channel is None:
                 user_dm_channel = await ia.user.create_dm()
@@ -103,30 +78,17 @@ class Freudr(ErrorHandledCog):
     @app_commands.describe()
     @check_user_is_verified()
     async def unlike(self, ia: Interaction, crush: Member):
-        crush_profile = await Profile.find_by_discord_id(crush.id)
-
-        if not crush_profile or not crush_profile.is_verified():
-            return await ia.response.send_message(
-                f"{crush.mention} is not verified, freudr commands only work on verified members",
-                ephemeral=True,
-            )
-
         if crush.id == ia.user.id:
             return await ia.response.send_message(
                 "https://www.wikihow.com/Love-Yourself", ephemeral=True
             )
 
-        profile = await Profile.find_by_discord_id(ia.user.id)
-
-        if crush.id not in profile.crushes:
+        if not await Crush.remove(ia.user.id, crush.id):
             return await ia.response.send_message(
                 f"I get that you don't like {crush.mention}, but they're not even in your list of crushes to begin with.",
                 ephemeral=True,
             )
 
-        profile.crushes.remove(crush.id)
-        await profile.save()
-
         await ia.response.send_message(
             f"Removed {crush.mention} from your list of crushes", ephemeral=True
         )
@@ -138,28 +100,22 @@ class Freudr(ErrorHandledCog):
     @app_commands.describe()
     @check_user_is_verified()
     async def show_list(self, ia: Interaction):
-        profile = await Profile.find_by_discord_id(ia.user.id)
+        await ia.response.defer(thinking=True, ephemeral=True)
 
-        if not profile.crushes:
-            return await ia.response.send_message(
+        user_crushes = await Crush.find_for(ia.user.id)
+
+        if not user_crushes:
+            return await ia.followup.send(
                 "You don't have any crushes, use '/freudr like <user>' to get started",
                 ephemeral=True,
             )
 
-        await ia.response.defer(thinking=True, ephemeral=True)
-
         matches = [
-            f"- <@{crush_id}> ❤️‍🔥"
-            for crush_id in profile.crushes
-            if (crush := await Profile.find_by_discord_id(crush_id))
-            and ia.user.id in crush.crushes
+            f"- <@{crush_id}> ❤️‍🔥" for crush_id, mutual in user_crushes if mutual
         ]
 
         crushes = [
-            f"- <@{crush_id}>"
-            for crush_id in profile.crushes
-            if (crush := await Profile.find_by_discord_id(crush_id))
-            and ia.user.id not in crush.crushes
+            f"- <@{crush_id}>" for crush_id, mutual in user_crushes if not mutual
         ]
 
         embeds = []
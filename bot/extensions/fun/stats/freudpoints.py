@@ -1,5 +1,4 @@
 from typing import Optional
-import asyncio
 
 from discord import (
     app_commands,
@@ -45,25 +44,17 @@ class FreudPoints(ErrorHandledCog):
                 ephemeral=True,
             )
 
-        awarder_stats = await ProfileStatistics.get(ia.user.id, ia.guild_id)
+        balances = await ProfileStatistics.transfer(
+            ia.user.id, user.id, ia.guild_id, amount
+        )
 
-        if awarder_stats.spendable_freudpoints < amount:
+        if balances is None:
             return await ia.response.send_message(
                 "You don't have enough FreudPoints available to give out!\nPlease wait a few days until you have enough",
                 ephemeral=True,
             )
 
-        awardee_stats = await ProfileStatistics.get(user.id, ia.guild_id)
-
-        awarder_stats.spendable_freudpoints -= amount
-        awardee_stats.freudpoints += amount
-
-        await asyncio.gather(
-            *[
-                awarder_stats.save(),
-                awardee_stats.save(),
-            ]
-        )
+        await self.bot.freudpoint_leaderboard.increment(ia.guild_id, user.id, amount)
 
         return await ia.response.send_message(
             f"{user.display_name} has been awarded {amount} FreudPoint(s)!",
@@ -1,34 +1,55 @@
+import re
+
 from discord import app_commands, Interaction, Member, Embed, SelectOption
-from discord.ui import View, Select
+from discord.ui import DynamicItem, View, Select
 
 from models.profile import Profile
 
 from bot.bot import Bot
 from bot.decorators import (
     check_user_is_verified,
+    get_requirements,
 )
 from bot.extensions import ErrorHandledCog
 from models.profile_statistics import ProfileStatistics
 
 
-class LeaderboardDropdown(Select["Leaderboard"]):
-    def __init__(self):
+class LeaderboardDropdown(
+    DynamicItem[Select], template=r"leaderboard:(?P<owner_id>[0-9]+)"
+):
+    """
+    Switches between the leaderboards of a guild
+
+    The owner of the message is kept in the custom_id, so the dropdown keeps
+    working after a restart without having to hold on to its view
+    """
+
+    def __init__(self, owner_id: int, selected: str = "freudpoint"):
+        self.owner_id = owner_id
+
         options = [
             SelectOption(
                 label="FreudPoint Rank",
                 value="freudpoint",
-                default=True,
+                default=selected == "freudpoint",
             ),
             SelectOption(
                 label="Confession Exposures",
                 value="exposed",
+                default=selected == "exposed",
             ),
         ]
 
-        super().__init__(options=options)
+        super().__init__(Select(options=options, custom_id=f"leaderboard:{owner_id}"))
+
+    @classmethod
+    async def from_custom_id(
+        cls, ia: Interaction, item: Select, match: re.Match[str]
+    ) -> "LeaderboardDropdown":
+        return cls(int(match["owner_id"]))
 
     async def callback(self, ia: Interaction):
-        if ia.user.id != self.view.owner.id:
+        if ia.user.id != self.owner_id:
             return await ia.response.send_message(
                 "That message doesn't belong to you.\nRun '/freudstat leaderboard' to get a message you can interact with",
                 ephemeral=True,
@@ -36,31 +57,25 @@ class LeaderboardDropdown(Select["Leaderboard"]):
 
         await ia.response.defer()
 
-        value = self.values[0]
+        value = self.item.values[0]
         if value == "freudpoint":
-            self.set_default_option(0)
             leaderboard = await self.make_freudpoint_leaderboard(ia)
         elif value == "exposed":
-            self.set_default_option(1)
             leaderboard = await self.make_exposed_leaderboard(ia)
         else:
             raise ValueError()
 
-        await ia.edit_original_response(embed=leaderboard, view=self.view)
-
-    def set_default_option(self, idx: int):
-        for opt in self.options:
-            opt.default = False
-
-        self.options[idx].default = True
+        await ia.edit_original_response(
+            embed=leaderboard, view=Leaderboard(self.owner_id, value)
+        )
 
     @staticmethod
     async def make_freudpoint_leaderboard(ia: Interaction) -> Embed:
-        top_10 = await ProfileStatistics.get_freudpoint_top_10(ia.guild_id)
+        top_10 = await ia.client.freudpoint_leaderboard.top(ia.guild_id)
 
         top_10 = [
-            f"#{i + 1} - <@{p.profile_discord_id}> ({p.freudpoints})"
-            for i, p in enumerate(top_10)
+            f"#{i + 1} - <@{discord_id}> ({freudpoints})"
+            for i, (discord_id, freudpoints) in enumerate(top_10)
         ]
 
         return Embed(
@@ -69,23 +84,21 @@ class LeaderboardDropdown(Select["Leaderboard"]):
 
     @staticmethod
     async def make_exposed_leaderboard(ia: Interaction) -> Embed:
-        top_10 = await ProfileStatistics.get_exposed_top_10(ia.guild_id)
+        top_10 = await ia.client.exposed_leaderboard.top(ia.guild_id)
 
         top_10 = [
-            f"#{i + 1} - <@{p.profile_discord_id}> ({p.confession_exposed_count})"
-            for i, p in enumerate(top_10)
+            f"#{i + 1} - <@{discord_id}> ({exposed_count})"
+            for i, (discord_id, exposed_count) in enumerate(top_10)
         ]
 
         return Embed(title="Most exposed members", description="\n".join(top_10))
 
 
 class Leaderboard(View):
-    def __init__(self, owner: Member):
-        super().__init__()
+    def __init__(self, owner_id: int, selected: str = "freudpoint"):
+        super().__init__(timeout=None)
 
-        self.owner: Member = owner
-
-        self.add_item(LeaderboardDropdown())
+        self.add_item(LeaderboardDropdown(owner_id, selected))
 
 
 class FreudStatOverview(ErrorHandledCog):
@@ -93,6 +106,16 @@ class FreudStatOverview(ErrorHandledCog):
         name="freudstat", description="FreudStats personal and global statistics"
     )
 
+    async def get_profile_card(
+        self, discord_id: int, guild_id: int
+    ) -> tuple[ProfileStatistics, int]:
+        """Get the statistics and rank of a profile, creating statistics if needed"""
+
+        stats = await ProfileStatistics.get(discord_id, guild_id)
+        rank = await self.bot.freudpoint_leaderboard.rank(guild_id, discord_id)
+
+        return stats, rank
+
     @freudstat_group.command(
         name="me",
         description="Get an overview of your personal FreudStats profile",
@@ -100,10 +123,7 @@ class FreudStatOverview(ErrorHandledCog):
     @app_commands.guild_only()
     @check_user_is_verified()
     async def show_me(self, ia: Interaction):
-        user = await Profile.find_by_discord_id(ia.user.id)
-        stats = await ProfileStatistics.get(ia.user.id, ia.guild_id)
-
-        rank = await user.get_freudpoint_rank(ia.guild_id)
+        stats, rank = await self.get_profile_card(ia.user.id, ia.guild_id)
 
         profile_embed = (
             Embed(title=f"{ia.user.display_name}s Profile", colour=ia.user.colour)
@@ -115,7 +135,9 @@ class FreudStatOverview(ErrorHandledCog):
             )
             .add_field(
                 name="Spendable FreudPoints",
-                value=stats.spendable_freudpoints,
+                value=stats.get_spendable_freudpoints(
+                    get_requirements(ia).config.max_spendable_freudpoints
+                ),
                 inline=True,
             )
             .add_field(
@@ -136,14 +158,14 @@ class FreudStatOverview(ErrorHandledCog):
     async def show_profile(self, ia: Interaction, user: Member):
         db_user = await Profile.find_by_discord_id(user.id)
 
+        if db_user is not None:
+            stats, rank = await self.get_profile_card(user.id, ia.guild_id)
+
         if db_user is None:
             return await ia.response.send_message(
                 f"{user.display_name} is not verified and doesn't have a profile"
             )
 
-        stats = await ProfileStatistics.get(user.id, ia.guild_id)
-        rank = await db_user.get_freudpoint_rank(ia.guild_id)
-
         profile_embed = (
             Embed(title=f"{user.display_name}s Profile", colour=user.colour)
             .set_thumbnail(url=user.display_avatar.url)
@@ -169,7 +191,7 @@ class FreudStatOverview(ErrorHandledCog):
     @check_user_is_verified()
     async def show_leaderboard(self, ia: Interaction):
         leaderboard = await LeaderboardDropdown.make_freudpoint_leaderboard(ia)
-        dropwdown = Leaderboard(ia.user)
+        dropwdown = Leaderboard(ia.user.id)
 
         await ia.response.send_message(
             embed=leaderboard,
@@ -178,4 +200,5 @@ class FreudStatOverview(ErrorHandledCog):
 
 
 async def setup(bot: Bot):
+    bot.add_dynamic_items(LeaderboardDropdown)
     await bot.add_cog(FreudStatOverview(bot))
@@ -1,6 +1,4 @@
-import asyncio
-import discord
-from discord import app_commands, Interaction, Role, TextChannel, Member
+from discord import app_commands, Interaction, Role, TextChannel
 from discord.ext import commands
 from discord.ext.commands import command, Context
 
@@ -9,8 +7,9 @@ from models.config import Config as ConfigModel
 
 from bot import util
 from bot.bot import Bot
-from bot.decorators import check_user_has_admin_role
+from bot.decorators import check_user_has_admin_role, get_requirements
 from bot.extensions import ErrorHandledCog
+from bot.role_sync import verified_role_diff
 
 
 class Config(ErrorHandledCog):
@@ -54,92 +53,87 @@ class Config(ErrorHandledCog):
             f"Set the admin role to {util.render_role(role)}"
         )
 
-    async def refresh_verified_role(self, ia: Interaction, role: Role):
+    async def refresh_verified_role(self, ia: Interaction, role: Role, prune: bool):
+        diff = await verified_role_diff(ia.guild, role, prune)
+        if not diff:
+            return await ia.response.send_message(
+                f"New verified role is the same as the old one\n{diff.summary()}"
+            )
+
         await ia.response.send_message(
-            "New verified role is the same as the old one\nRefreshing role for all verified members...\nThis message will be updated when everything is completed"
+            f"New verified role is the same as the old one\n{diff.summary()}\nRefreshing role...\nThis message will be updated while the members are updated"
         )
-
-        verified_profiles = await Profile.find_verified_in_guild(ia.guild)
-
-        # member_coroutines = []
-        # for profile in verified_profiles:
-        #     member_coroutines.append(ia.guild.fetch_member(profile.discord_id))
-
-        # members: list[Member] = await asyncio.gather(*member_coroutines)
-
-        members: list[Member] = []
-        for profile in verified_profiles:
-            members.append(ia.guild.get_member(profile.discord_id))
-
-        role_coroutines = []
-        for member in members:
-            if member.get_role(role.id) is not None:
-                continue
-
-            role_coroutines.append(member.add_roles(role))
-
-        await asyncio.gather(*role_coroutines)
-
-        await ia.edit_original_response(
-            content=f"Verified role refreshed, {len(members)} members updated"
+        message = await ia.original_response()
+
+        started = await self.bot.role_sync.start(
+            self.bot,
+            ia.guild,
+            "Refreshing verified role",
+            role.id,
+            message,
+            add=diff.add,
+            remove=diff.removals,
         )
+        if not started:
+            await ia.edit_original_response(
+                content="Roles are already being updated in this server, try again once that is done"
+            )
 
     @config_group.command(
         name="verified_role",
         description="Set the role to be applied to members once they have been verified",
     )
-    @app_commands.describe(role="The role to be applied")
+    @app_commands.describe(
+        role="The role to be applied",
+        prune="When refreshing the current role, also take it from members that aren't verified",
+    )
     @app_commands.guild_only()
     @check_user_has_admin_role()
-    async def set_verified_role(self, ia: Interaction, role: Role):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+    async def set_verified_role(self, ia: Interaction, role: Role, prune: bool = False):
+        guild_config = get_requirements(ia).config
 
         old_verified_role = None
         if guild_config.verified_role is not None:
-            old_verified_role = discord.utils.get(
-                ia.guild.roles, id=guild_config.verified_role
-            )
+            old_verified_role = ia.guild.get_role(guild_config.verified_role)
 
         if old_verified_role == role:
-            await self.refresh_verified_role(ia, role)
+            await self.refresh_verified_role(ia, role, prune)
             return
 
         await ia.response.send_message(
-            "Updating verified role...\nThis message will be updated when everything is completed"
+            "Updating verified role...\nThis message will be updated while the members are updated"
         )
-
-        verified_profiles = await Profile.find_verified_in_guild(ia.guild)
-
-        # member_coroutines = []
-        # for profile in verified_profiles:
-        #     member_coroutines.append(ia.guild.fetch_member(profile.discord_id))
-
-        # members: list[Member] = await asyncio.gather(*member_coroutines)
-
-        members: list[Member] = []
-        for profile in verified_profiles:
-            members.append(ia.guild.get_member(profile.discord_id))
-
-        role_coroutines = []
-        for member in members:
-            role_coroutines.append(member.add_roles(role))
-
-            if (
-                old_verified_role is not None
-                and member.get_role(old_verified_role.id) is not None
-            ):
-                role_coroutines.append(member.remove_roles(old_verified_role))
-
-        await asyncio.gather(*role_coroutines)
+        message = await ia.original_response()
+
+        # Members that had the new role before it became the verified role
+        # keep it, only verified members that are missing it are updated
+        diff = await verified_role_diff(ia.guild, role)
+
+        remove: set[int] = set()
+        if old_verified_role is not None:
+            verified = await Profile.find_verified_ids_in_guild(ia.guild)
+            remove = {member.id for member in old_verified_role.members} & verified
+
+        started = await self.bot.role_sync.start(
+            self.bot,
+            ia.guild,
+            f"Setting the verified role to {util.render_role(role)}",
+            role.id,
+            message,
+            add=diff.add,
+            remove=remove,
+            remove_role_id=old_verified_role.id if old_verified_role else None,
+        )
+        if not started:
+            return await ia.edit_original_response(
+                content="Roles are already being updated in this server, try again once that is done"
+            )
 
         guild_config.verified_role = role.id
         await guild_config.save()
 
         self.bot.logger.info(
-            f"set verified role for {util.render_guild(ia.guild)} to {util.render_role(role)}, {len(members)} members updated"
-        )
-        await ia.edit_original_response(
-            content=f"Set the verified role to {util.render_role(role)}, {len(members)} members updated"
+            f"set verified role for {util.render_guild(ia.guild)} to {util.render_role(role)}, {len(diff.add)} members to add, {len(remove)} to remove from the old role"
         )
 
     @config_group.command(
@@ -150,7 +144,7 @@ class Config(ErrorHandledCog):
     @app_commands.guild_only()
     @check_user_has_admin_role()
     async def set_logging_channel(self, ia: Interaction, channel: TextChannel):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+        guild_config = get_requirements(ia).config
 
         guild_config.logging_channel = channel.id
         await guild_config.save()
@@ -172,7 +166,7 @@ class Config(ErrorHandledCog):
     async def set_confession_approval_channel(
         self, ia: Interaction, channel: TextChannel
     ):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+        guild_config = get_requirements(ia).config
 
         guild_config.confession_approval_channel = channel.id
         await guild_config.save()
@@ -192,7 +186,7 @@ class Config(ErrorHandledCog):
     @app_commands.guild_only()
     @check_user_has_admin_role()
     async def set_confession_channel(self, ia: Interaction, channel: TextChannel):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+        guild_config = get_requirements(ia).config
 
         guild_config.confession_channel = channel.id
         await guild_config.save()
@@ -217,7 +211,7 @@ class Config(ErrorHandledCog):
     async def set_verification_email_credentials(
         self, ia: Interaction, email: str, password: str
     ):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+        guild_config = get_requirements(ia).config
 
         guild_config.verification_email_smtp_user = email
         guild_config.verification_email_smtp_password = password
@@ -240,7 +234,7 @@ class Config(ErrorHandledCog):
     async def set_verification_email_content(
         self, ia: Interaction, subject: str | None = None, body: str | None = None
     ):
-        guild_config = await ConfigModel.get_or_create(ia.guild)
+        guild_config = get_requirements(ia).config
 
         if subject:
             guild_config.verification_email_subject = subject
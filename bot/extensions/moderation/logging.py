@@ -3,7 +3,7 @@ from logging import Filter
 
 from discord import Guild
 
-from models.config import Config
+from models.config import Config, cache as config_cache
 
 from bot import root_logger, util
 from bot.bot import Bot
@@ -33,6 +33,9 @@ class ModLogging(ErrorHandledCog):
         bot_logger = root_logger.getChild("bot")
         self.bot.logger = bot_logger
 
+        await config_cache.listen()
+        await Config.warm_cache([guild.id for guild in self.bot.guilds])
+
         logger.info("ready")
 
     @ErrorHandledCog.listener()
@@ -42,7 +45,7 @@ class ModLogging(ErrorHandledCog):
     @ErrorHandledCog.listener()
     async def on_guild_join(self, guild: Guild):
         logger.info(f"joined guild {util.render_guild(guild)}")
-        await Config.create(guild_id=guild.id)
+        await Config.get_or_insert(guild_id=guild.id)
         logger.info(f"created config for guild {util.render_guild(guild)}")
 
 
@@ -1,56 +1,29 @@
 import asyncio
-import logging
 import re
-import smtplib
-import uuid
 
 import discord
 from discord import app_commands, Interaction, Member, Locale, ButtonStyle, Guild
-from discord.ui import View, Button, Modal, TextInput
+from discord.ui import DynamicItem, View, Button, Modal, TextInput
 
 from models.profile import Profile
 from models.config import Config
 
 from bot.bot import Bot
-from bot.decorators import (
-    check_has_config_option,
-    check_user_has_admin_role,
-)
+from bot.constants import LogMessages, Messages
+from bot.decorators import get_requirements, requires
 from bot.exceptions import MissingConfig, MissingConfigOption
 from bot.extensions import ErrorHandledCog
+from bot.join_batcher import JoinBatcher
+from bot.rate_limit import TokenBucket
+from bot.role_grants import RoleChange
+from bot.role_sync import verified_role_diff
+from bot.verification_codes import CodeCheck
 from models.profile_statistics import ProfileStatistics
 
 
 EMAIL_REGEX = re.compile(r"^[^\s@]+@ugent\.be$")
 CODE_REGEX = re.compile(r"^['|<]?([a-z0-9]{32})[>|']?$")
 
-EMAIL_MESSAGE = "From: {from_}\nTo: {to}\nSubject: {subject}\n\n{body}"
-
-
-email_logger = logging.getLogger("email")
-
-
-def send_confirmation_email(
-    from_: str, password: str, to: str, subject: str, body: str, code: str
-):
-    actual_body = body.format(code=code)
-    message = EMAIL_MESSAGE.format(
-        from_=from_, to=to, subject=subject, body=actual_body
-    )
-
-    email_logger.info(f"creating email to {to}")
-    server = smtplib.SMTP("smtp.gmail.com", 587)
-
-    server.ehlo()
-    server.starttls()
-    server.login(from_, password)
-
-    server.sendmail(from_, to, message)
-
-    server.close()
-
-    email_logger.info(f"sent email to {to}")
-
 
 class VerifyEmailModal(Modal):
     email = TextInput(label="email", placeholder="jan.peeters@ugent.be")
@@ -83,55 +56,15 @@ class VerifyEmailModal(Modal):
             )
 
         author_id = ia.user.id
-        verification_code = str(uuid.uuid4().hex)
-
-        profile = await Profile.find_by_discord_id(author_id)
-        if profile is not None:
-            if profile.confirmation_code is None:
-                self.bot.discord_logger.warning(
-                    f"user {ia.user.mention} attempted to verify despite already being verified",
-                    guild=self.guild,
-                    log_type="verification",
-                )
-
-                return await ia.response.send_message(
-                    guild_config.already_verified_message
-                )
-
-            profile.confirmation_code = verification_code
-            # Users might have mistyped their email, update it just in case
-            old = profile.email
-            profile.email = email
-            await profile.save()
-
-            send_confirmation_email(
-                guild_config.verification_email_smtp_user,
-                guild_config.verification_email_smtp_password,
-                email,
-                guild_config.verification_email_subject,
-                guild_config.verification_email_body,
-                verification_code,
-            )
 
-            verify_code_view = View(timeout=None)
-            verify_code_view.add_item(
-                VerifyCodeButton(
-                    bot=self.bot,
-                    guild=self.guild,
-                    locale=self.locale,
-                )
-            )
-
-            self.bot.discord_logger.info(
-                f"user {ia.user.mention} re-requested a verification code for '{email}'",
+        if await Profile.is_discord_id_verified(author_id):
+            self.bot.discord_logger.warning(
+                f"user {ia.user.mention} attempted to verify despite already being verified",
                 guild=self.guild,
                 log_type="verification",
             )
 
-            return await ia.response.send_message(
-                str(guild_config.new_email_message).format(old=old, new=email),
-                view=verify_code_view,
-            )
+            return await ia.response.send_message(guild_config.already_verified_message)
 
         other = await Profile.find_by_email(email)
         if other is not None:
@@ -145,32 +78,36 @@ class VerifyEmailModal(Modal):
                 str(guild_config.duplicate_email_message).format(email=email)
             )
 
-        self.bot.discord_logger.info(
-            f"user {ia.user.mention} requested verification code for '{email}'",
-            guild=self.guild,
-            log_type="verification",
-        )
+        # Users might have mistyped their email, a new code always uses the
+        # latest one
+        pending = await self.bot.verification_codes.get(author_id)
+        verification_code = await self.bot.verification_codes.start(author_id, email)
 
-        await Profile.create(
-            discord_id=author_id, email=email, confirmation_code=verification_code
-        )
-
-        send_confirmation_email(
-            guild_config.verification_email_smtp_user,
-            guild_config.verification_email_smtp_password,
-            email,
-            guild_config.verification_email_subject,
-            guild_config.verification_email_body,
-            verification_code,
-        )
+        await self.bot.mail_queue.enqueue(self.guild.id, email, verification_code)
 
         verify_code_view = View(timeout=None)
         verify_code_view.add_item(
-            VerifyCodeButton(
-                bot=self.bot,
+            VerifyCodeButton(guild_id=self.guild.id, locale=self.locale)
+        )
+
+        if pending is not None:
+            self.bot.discord_logger.info(
+                f"user {ia.user.mention} re-requested a verification code for '{email}'",
                 guild=self.guild,
-                locale=self.locale,
+                log_type="verification",
+            )
+
+            return await ia.response.send_message(
+                str(guild_config.new_email_message).format(
+                    old=pending.email, new=email
+                ),
+                view=verify_code_view,
             )
+
+        self.bot.discord_logger.info(
+            f"user {ia.user.mention} requested verification code for '{email}'",
+            guild=self.guild,
+            log_type="verification",
         )
 
         return await ia.response.send_message(
@@ -199,26 +136,11 @@ class VerifyCodeModal(Modal):
         await ia.response.defer(thinking=True)
 
         author_id = ia.user.id
-        profile = await Profile.find_by_discord_id(author_id)
 
         guild_config = await Config.get(self.guild.id)
         if guild_config is None:
             raise MissingConfig(self.guild)
 
-        if profile is None:
-            # This should not be reachable
-            # Users cannot access this modal without first sending in their email
-            raise Exception()
-
-        if profile.confirmation_code is None:
-            self.bot.discord_logger.warning(
-                f"user {ia.user.mention} attempted to verify despite already being verified",
-                guild=self.guild,
-                log_type="verification",
-            )
-
-            return await ia.followup.send(guild_config.already_verified_message)
-
         code = ""
         if match := CODE_REGEX.search(self.code.value):
             code = match.group(1)
@@ -233,56 +155,63 @@ class VerifyCodeModal(Modal):
                 str(guild_config.invalid_code_message).format(code=self.code.value)
             )
 
-        stored_code: str = profile.confirmation_code
+        outcome, pending = await self.bot.verification_codes.check(author_id, code)
+
+        if outcome == CodeCheck.EXPIRED:
+            if await Profile.is_discord_id_verified(author_id):
+                self.bot.discord_logger.warning(
+                    f"user {ia.user.mention} attempted to verify despite already being verified",
+                    guild=self.guild,
+                    log_type="verification",
+                )
+
+                return await ia.followup.send(guild_config.already_verified_message)
 
-        if code != stored_code:
             self.bot.discord_logger.warning(
-                f"user {ia.user.mention} attempted to verify with an invalid code '{code}', expected '{stored_code}'",
+                LogMessages.NO_PENDING_VERIFICATION.format(
+                    user=ia.user.mention, code=code
+                ),
                 guild=self.guild,
                 log_type="verification",
             )
 
-            return await ia.followup.send(
-                str(guild_config.invalid_code_message).format(code=code)
-            )
-
-        async def verify_member_in_guild(guild: Guild):
-            guild_config = await Config.get(guild.id)
-            if guild_config is None:
-                return
-
-            verified_role = guild_config.verified_role
-            if verified_role is None:
-                return
+            return await ia.followup.send(Messages.VERIFICATION_EXPIRED)
 
-            member = guild.get_member(ia.user.id)
-            if member is None:
-                return
-
-            await member.add_roles(guild.get_role(verified_role))
-
-            await ProfileStatistics.create(
-                profile_discord_id=ia.user.id, config_guild_id=guild.id
+        if outcome == CodeCheck.TOO_MANY_ATTEMPTS:
+            self.bot.discord_logger.warning(
+                LogMessages.TOO_MANY_ATTEMPTS.format(user=ia.user.mention),
+                guild=self.guild,
+                log_type="verification",
             )
 
-            self.bot.discord_logger.info(
-                f"{ia.user.mention} verified succesfully with email {profile.email} from within server '{self.guild.name}'",
-                guild=guild,
+            return await ia.followup.send(Messages.TOO_MANY_ATTEMPTS)
+
+        if outcome == CodeCheck.MISMATCH:
+            self.bot.discord_logger.warning(
+                f"user {ia.user.mention} attempted to verify with an invalid code '{code}', expected '{pending.code}'",
+                guild=self.guild,
                 log_type="verification",
             )
 
-        # Verify the user in the guild they used the command in
-        verified_role = guild_config.verified_role
-        member = self.guild.get_member(ia.user.id)
+            return await ia.followup.send(
+                str(guild_config.invalid_code_message).format(code=code)
+            )
 
-        await member.add_roles(self.guild.get_role(verified_role))
+        profile = await Profile.create_verified(author_id, pending.email)
+        await self.bot.verification_codes.finish(author_id)
 
-        profile.confirmation_code = None
-        await profile.save()
+        if profile is None:
+            # Somebody else verified with the same email since the code was
+            # sent
+            self.bot.discord_logger.warning(
+                f"user {ia.user.mention} attempted to verify with duplicate email '{pending.email}'",
+                guild=self.guild,
+                log_type="verification",
+            )
 
-        await ProfileStatistics.create(
-            profile_discord_id=ia.user.id, config_guild_id=self.guild.id
-        )
+            return await ia.followup.send(
+                str(guild_config.duplicate_email_message).format(email=pending.email)
+            )
 
         self.bot.discord_logger.info(
             f"{ia.user.mention} verified succesfully with email '{profile.email}'",
@@ -290,101 +219,205 @@ class VerifyCodeModal(Modal):
             log_type="verification",
         )
 
-        # Verify the user in any other freud-enabled guilds
-        other_guilds = list(filter(lambda g: g.id != self.guild.id, self.bot.guilds))
-        other_guild_coroutines = [verify_member_in_guild(g) for g in other_guilds]
-        await asyncio.gather(*other_guild_coroutines)
+        # Verify the user in every freud-enabled guild they share with the bot
+        shared_guilds = [
+            guild
+            for guild in self.bot.guilds
+            if guild.id == self.guild.id or guild.get_member(ia.user.id) is not None
+        ]
+        configs = await Config.get_many([guild.id for guild in shared_guilds])
+
+        changes = [
+            RoleChange(guild, ia.user.id, configs[guild.id].verified_role)
+            for guild in shared_guilds
+            if guild.id in configs and configs[guild.id].verified_role is not None
+        ]
+
+        await ProfileStatistics.upsert_many(
+            [
+                {"profile_discord_id": ia.user.id, "config_guild_id": change.guild.id}
+                for change in changes
+            ]
+        )
+
+        results = await self.bot.role_executor.run(changes)
+
+        for change, result in zip(changes, results):
+            if not result.ok:
+                self.bot.discord_logger.error(
+                    f"could not give {ia.user.mention} the verified role: {result.value}",
+                    guild=change.guild,
+                    log_type="verification",
+                )
+            elif change.guild.id != self.guild.id:
+                self.bot.discord_logger.info(
+                    f"{ia.user.mention} verified succesfully with email {profile.email} from within server '{self.guild.name}'",
+                    guild=change.guild,
+                    log_type="verification",
+                )
 
         return await ia.followup.send(
             str(guild_config.welcome_message).format(guild_name=self.guild.name)
         )
 
 
-class VerifyEmailButton(Button):
-    def __init__(self, bot: Bot, guild: Guild, locale: Locale, *args, **kwargs):
-        self.bot = bot
-        self.guild = guild
-        self.locale = locale
+class VerifyEmailButton(
+    DynamicItem[Button], template=r"verify:email:(?P<guild_id>[0-9]+)"
+):
+    """
+    Opens the email modal for a guild
+
+    The guild is kept in the custom_id, so the button keeps working after a
+    restart without having to hold on to the view it was sent with
+    """
+
+    def __init__(self, guild_id: int, locale: Locale) -> None:
+        self.guild_id = guild_id
 
         label = "Verifieer je email" if locale == Locale.dutch else "Verify your email"
 
-        super().__init__(*args, style=ButtonStyle.green, label=label, **kwargs)
+        super().__init__(
+            Button(
+                style=ButtonStyle.green,
+                label=label,
+                custom_id=f"verify:email:{guild_id}",
+            )
+        )
+
+    @classmethod
+    async def from_custom_id(
+        cls, ia: Interaction, item: Button, match: re.Match[str]
+    ) -> "VerifyEmailButton":
+        return cls(int(match["guild_id"]), ia.locale)
 
     async def callback(self, ia: Interaction):
+        guild = ia.client.get_guild(self.guild_id)
+        if guild is None:
+            return await ia.response.send_message(
+                "I'm no longer in the server this button belongs to"
+            )
+
         await ia.response.send_modal(
-            VerifyEmailModal(bot=self.bot, guild=self.guild, locale=ia.locale)
+            VerifyEmailModal(bot=ia.client, guild=guild, locale=ia.locale)
         )
 
 
-class VerifyCodeButton(Button):
-    def __init__(self, bot: Bot, guild: Guild, locale: Locale, *args, **kwargs):
-        self.bot = bot
-        self.guild = guild
+class VerifyCodeButton(
+    DynamicItem[Button],
+    template=r"verify:code:(?P<guild_id>[0-9]+):(?P<locale>[A-Za-z-]+)",
+):
+    """
+    Opens the code modal for a guild
+
+    The guild and locale are kept in the custom_id, so the button keeps
+    working after a restart without having to hold on to the view it was sent
+    with
+    """
+
+    def __init__(self, guild_id: int, locale: Locale) -> None:
+        self.guild_id = guild_id
         self.locale = locale
 
         label = "Verifieer je code" if locale == Locale.dutch else "Verify your code"
 
-        super().__init__(*args, style=ButtonStyle.green, label=label, **kwargs)
+        super().__init__(
+            Button(
+                style=ButtonStyle.green,
+                label=label,
+                custom_id=f"verify:code:{guild_id}:{locale.value}",
+            )
+        )
+
+    @classmethod
+    async def from_custom_id(
+        cls, ia: Interaction, item: Button, match: re.Match[str]
+    ) -> "VerifyCodeButton":
+        try:
+            locale = Locale(match["locale"])
+        except ValueError:
+            locale = ia.locale
+
+        return cls(int(match["guild_id"]), locale)
 
     async def callback(self, ia: Interaction):
+        guild = ia.client.get_guild(self.guild_id)
+        if guild is None:
+            return await ia.response.send_message(
+                "I'm no longer in the server this button belongs to"
+            )
+
         await ia.response.send_modal(
-            VerifyCodeModal(bot=self.bot, guild=self.guild, locale=self.locale)
+            VerifyCodeModal(bot=ia.client, guild=guild, locale=self.locale)
         )
 
 
 class Verification(ErrorHandledCog):
+    def __init__(self, bot: Bot) -> None:
+        super().__init__(bot)
+
+        # Joins come in bursts at the start of the year, handle them in
+        # batches and pace the DMs they cause
+        self.joins = JoinBatcher(self.handle_join_batch)
+        self.dm_slots = asyncio.Semaphore(4)
+        self.dm_bucket = TokenBucket(5, 5)
+
+    async def cog_unload(self):
+        await self.joins.close()
+
     @app_commands.command(
         name="verifix",
-        description="Check that every verified member has the verified role",
+        description="Check that exactly the verified members have the verified role",
+    )
+    @app_commands.describe(
+        dry_run="Only report which members would be updated, without changing any roles",
+        prune="Also take the role from members that have it without being verified",
     )
     @app_commands.guild_only()
-    @check_has_config_option("verified_role")
-    @check_user_has_admin_role()
-    async def verifix(self, ia: Interaction):
-        guild_config = await Config.get(ia.guild_id)
-        verified_role = discord.utils.get(ia.guild.roles, id=guild_config.verified_role)
+    @requires("verified_role", admin=True)
+    async def verifix(
+        self, ia: Interaction, dry_run: bool = False, prune: bool = False
+    ):
+        verified_role = get_requirements(ia).roles["verified_role"]
 
-        await ia.response.send_message(
-            "Checking members...\nThis message will be updated when everything is completed"
-        )
-
-        verified_profiles = await Profile.find_verified_in_guild(ia.guild)
-
-        members: list[Member] = []
-        for profile in verified_profiles:
-            members.append(ia.guild.get_member(profile.discord_id))
-
-        role_coroutines = []
-        not_updated = 0
-        for member in members:
-            if member.get_role(verified_role.id) is not None:
-                not_updated += 1
-                continue
-
-            role_coroutines.append(member.add_roles(verified_role))
+        diff = await verified_role_diff(ia.guild, verified_role, prune)
 
-        await asyncio.gather(*role_coroutines)
+        if dry_run or not diff:
+            return await ia.response.send_message(diff.summary())
 
-        await ia.edit_original_response(
-            content=f"{len(members)} verified members checked, {len(members) - not_updated} members updated"
+        await ia.response.send_message(
+            f"{diff.summary()}\nUpdating members...\nThis message will be updated while the members are updated"
+        )
+        message = await ia.original_response()
+
+        started = await self.bot.role_sync.start(
+            self.bot,
+            ia.guild,
+            "Fixing verified role",
+            verified_role.id,
+            message,
+            add=diff.add,
+            remove=diff.removals,
         )
+        if not started:
+            await ia.edit_original_response(
+                content="Roles are already being updated in this server, try again once that is done"
+            )
 
     @app_commands.command(
         name="verify", description="Verify that you are a true UGentStudent"
     )
     @app_commands.guild_only()
-    @check_has_config_option("verified_role")
-    @check_has_config_option("verification_email_smtp_user")
-    @check_has_config_option("verification_email_smtp_password")
+    @requires(
+        "verified_role",
+        "verification_email_smtp_user",
+        "verification_email_smtp_password",
+    )
     async def verify(self, ia: Interaction):
-        guild_config = await Config.get(ia.guild.id)
-        if guild_config is None:
-            raise MissingConfig(ia.guild)
+        guild_config = get_requirements(ia).config
 
         await ia.response.defer(ephemeral=True, thinking=True)
 
-        profile = await Profile.find_by_discord_id(ia.user.id)
-        if profile is not None and profile.confirmation_code is None:
+        if await Profile.is_discord_id_verified(ia.user.id):
             self.bot.discord_logger.warning(
                 f"user {ia.user.mention} attempted to verify despite already being verified",
                 guild=ia.guild,
@@ -395,7 +428,7 @@ class Verification(ErrorHandledCog):
 
         verify_email_view = View(timeout=None)
         verify_email_view.add_item(
-            VerifyEmailButton(bot=self.bot, guild=ia.guild, locale=ia.locale)
+            VerifyEmailButton(guild_id=ia.guild.id, locale=ia.locale)
         )
 
         dm_channel = (
@@ -431,14 +464,23 @@ class Verification(ErrorHandledCog):
 
         await ia.response.defer(ephemeral=True, thinking=True)
 
-        profile_statistics = await ProfileStatistics.get_all_for_user(user.id)
-        stat_futures = [stat.delete() for stat in profile_statistics]
-        await asyncio.gather(*stat_futures)
+        profile_statistics = await ProfileStatistics.delete_where(
+            ProfileStatistics.profile_discord_id == user.id
+        )
+
+        leaderboard_futures = [
+            leaderboard.remove(stat.config_guild_id, user.id)
+            for stat in profile_statistics
+            for leaderboard in self.bot.leaderboards
+        ]
+        await asyncio.gather(*leaderboard_futures)
 
         profile = await Profile.find_by_discord_id(user.id)
         if profile:
             await profile.delete()
 
+        await self.bot.verification_codes.finish(user.id)
+
         if guild_config.verified_role:
             verified_role = discord.utils.get(
                 ia.guild.roles, id=guild_config.verified_role
@@ -459,7 +501,10 @@ class Verification(ErrorHandledCog):
         if member.bot:
             return
 
-        guild = member.guild
+        self.joins.add(member)
+
+    async def handle_join_batch(self, guild: Guild, members: list[Member]):
+        """Verify or DM a batch of members that just joined the same guild"""
 
         # Exit if there's no verified role configured yet
         guild_config = await Config.get(guild.id)
@@ -472,53 +517,79 @@ class Verification(ErrorHandledCog):
         if guild_config.verification_email_smtp_password is None:
             raise MissingConfigOption("verification_email_smtp_password")
 
-        profile = await Profile.find_by_discord_id(member.id)
+        profiles = {
+            profile.discord_id: profile
+            for profile in await Profile.find_by_discord_ids(
+                [member.id for member in members]
+            )
+        }
 
         # If the profile is already verified somewhere else, verify them here
         # as well
-        if (
-            profile is not None
-            and profile.email is not None
-            and profile.confirmation_code is None
-        ):
-            await member.add_roles(
-                discord.utils.get(guild.roles, id=guild_config.verified_role)
-            )
-
-            await ProfileStatistics.create(
-                profile_discord_id=member.id, config_guild_id=guild.id
-            )
-
-            self.bot.discord_logger.info(
-                f"{member.mention} has been automatically verified, their email is {profile.email}",
-                guild=guild,
-                log_type="verification",
-            )
+        verified = [member for member in members if member.id in profiles]
+        unverified = [member for member in members if member.id not in profiles]
+
+        await ProfileStatistics.upsert_many(
+            [
+                {"profile_discord_id": member.id, "config_guild_id": guild.id}
+                for member in verified
+            ]
+        )
 
-            return
+        changes = [
+            RoleChange(guild, member.id, guild_config.verified_role)
+            for member in verified
+        ]
 
         self.bot.logger.info(
-            f"sending verification DM to {member.mention} [{member.name}]"
+            f"handling {len(members)} joins in guild {guild.id}: {len(verified)} already verified, sending {len(unverified)} verification DMs"
         )
 
         # If the profile is not verified yet send them through the
         # verification process
-        dm_channel = member.dm_channel
-        if dm_channel is None:
-            dm_channel = await member.create_dm()
+        content = str(guild_config.verify_email_message).format(guild_name=guild.name)
+        results, _ = await asyncio.gather(
+            self.bot.role_executor.run(changes),
+            asyncio.gather(
+                *(self.send_verification_dm(member, content) for member in unverified)
+            ),
+        )
+
+        for member, result in zip(verified, results):
+            if result.ok:
+                self.bot.discord_logger.info(
+                    f"{member.mention} has been automatically verified, their email is {profiles[member.id].email}",
+                    guild=guild,
+                    log_type="verification",
+                )
+            else:
+                self.bot.discord_logger.error(
+                    f"could not give {member.mention} the verified role: {result.value}",
+                    guild=guild,
+                    log_type="verification",
+                )
 
+    async def send_verification_dm(self, member: Member, content: str):
         verify_email_view = View(timeout=None)
         verify_email_view.add_item(
-            VerifyEmailButton(bot=self.bot, guild=guild, locale=guild.preferred_locale)
+            VerifyEmailButton(
+                guild_id=member.guild.id, locale=member.guild.preferred_locale
+            )
         )
 
-        await dm_channel.send(
-            content=str(guild_config.verify_email_message).format(
-                guild_name=guild.name
-            ),
-            view=verify_email_view,
-        )
+        async with self.dm_slots:
+            await self.dm_bucket.acquire()
+
+            try:
+                await member.send(content=content, view=verify_email_view)
+            except discord.HTTPException as e:
+                self.bot.discord_logger.warning(
+                    f"could not send a verification DM to {member.mention}: {e}",
+                    guild=member.guild,
+                    log_type="verification",
+                )
 
 
 async def setup(bot: Bot):
+    bot.add_dynamic_items(VerifyEmailButton, VerifyCodeButton)
     await bot.add_cog(Verification(bot))
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from discord import Guild, Member
+
+
+logger = logging.getLogger("join_batcher")
+
+
+JoinHandler = Callable[[Guild, list[Member]], Awaitable[None]]
+
+
+class JoinBatcher:
+    """
+    Collects member joins per guild and hands them to `handler` in batches
+
+    A batch is handed off `window` seconds after its first join, or as soon as
+    it holds `max_size` joins, so no join waits longer than `window` before it
+    is handled. Members that join more than once within a window only show up
+    in the batch once.
+    """
+
+    def __init__(
+        self, handler: JoinHandler, window: float = 2, max_size: int = 100
+    ) -> None:
+        self.handler = handler
+        self.window = window
+        self.max_size = max_size
+
+        self.pending: dict[int, dict[int, Member]] = {}
+        self.timers: dict[int, asyncio.TimerHandle] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def add(self, member: Member):
+        """Add a join to the batch of its guild"""
+
+        guild_id = member.guild.id
+
+        batch = self.pending.setdefault(guild_id, {})
+        batch[member.id] = member
+
+        if len(batch) >= self.max_size:
+            self.flush(guild_id)
+        elif guild_id not in self.timers:
+            self.timers[guild_id] = asyncio.get_running_loop().call_later(
+                self.window, self.flush, guild_id
+            )
+
+    def flush(self, guild_id: int):
+        """Hand off the batch of a guild right away"""
+
+        timer = self.timers.pop(guild_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self.pending.pop(guild_id, None)
+        if not batch:
+            return
+
+        members = list(batch.values())
+
+        task = asyncio.create_task(self._handle(members[0].guild, members))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _handle(self, guild: Guild, members: list[Member]):
+        try:
+            await self.handler(guild, members)
+        except Exception:
+            logger.exception(
+                f"failed to handle {len(members)} joins in guild {guild.id}"
+            )
+
+    async def close(self):
+        """Hand off all pending batches and wait until they are handled"""
+
+        for guild_id in list(self.pending):
+            self.flush(guild_id)
+
+        await asyncio.gather(*self.tasks)
@@ -0,0 +1,150 @@
+import logging
+
+from redis.asyncio import Redis
+
+from models.profile_statistics import ProfileStatistics
+
+
+logger = logging.getLogger("leaderboard")
+
+
+class Leaderboard:
+    """
+    Per-guild Redis sorted sets mirroring a profile_statistics column
+
+    A guild's set is built from the database the first time it is read, after
+    that it is kept up to date by the code paths that change the column.
+
+    Profiles with a score of 0 are left out of the sets, so newly verified
+    members don't have to be added to them
+    """
+
+    def __init__(self, redis: Redis, name: str, column: str) -> None:
+        self.redis = redis
+        self.name = name
+        self.column = column
+
+    def key(self, guild_id: int) -> str:
+        return f"leaderboard:{self.name}:{guild_id}"
+
+    def built_key(self, guild_id: int) -> str:
+        return f"leaderboard:{self.name}:{guild_id}:built"
+
+    async def rebuild(self, guild_id: int, scores: dict[int, int] | None = None):
+        """Rebuild a guilds sorted set from the database"""
+
+        if scores is None:
+            scores = await self.get_scores(guild_id)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key(guild_id))
+            if scores:
+                pipe.zadd(self.key(guild_id), scores)
+            pipe.set(self.built_key(guild_id), 1)
+
+            await pipe.execute()
+
+        logger.info(f"rebuilt {self.name} leaderboard for guild {guild_id}")
+
+    async def get_scores(self, guild_id: int) -> dict[int, int]:
+        """Get the non-zero scores of a guild from the database"""
+
+        return {
+            discord_id: score
+            for discord_id, score in await ProfileStatistics.get_scores(
+                guild_id, self.column
+            )
+            if score != 0
+        }
+
+    async def increment(self, guild_id: int, discord_id: int, amount: int):
+        """
+        Add `amount` to the score of a profile in a guild, after the change
+        was committed to the database
+
+        Concurrent increments add up in any order. A failure is only logged,
+        the change is already committed and the next drift check repairs the
+        set.
+        """
+
+        try:
+            await self.redis.zincrby(self.key(guild_id), amount, discord_id)
+        except Exception:
+            logger.exception(
+                f"failed to update {self.name} leaderboard for guild {guild_id}, leaving it to the drift check"
+            )
+
+    async def remove(self, guild_id: int, discord_id: int):
+        """Remove a profile from a guilds leaderboard"""
+
+        await self.redis.zrem(self.key(guild_id), discord_id)
+
+    async def top(self, guild_id: int, count: int = 10) -> list[tuple[int, int]]:
+        """Get the `count` highest scoring profiles in a guild"""
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self.built_key(guild_id))
+            pipe.zrevrange(self.key(guild_id), 0, count - 1, withscores=True)
+
+            built, entries = await pipe.execute()
+
+        if not built:
+            await self.rebuild(guild_id)
+            entries = await self.redis.zrevrange(
+                self.key(guild_id), 0, count - 1, withscores=True
+            )
+
+        return [(int(member), int(score)) for member, score in entries]
+
+    async def rank(self, guild_id: int, discord_id: int) -> int:
+        """
+        Get the rank of a profile in a guild, ranks start at 0
+
+        Ties are ordered the same way as in `top`. Profiles without a score
+        share the rank after the last profile that has one.
+        """
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self.built_key(guild_id))
+            pipe.zrevrank(self.key(guild_id), discord_id)
+            pipe.zcard(self.key(guild_id))
+
+            built, rank, size = await pipe.execute()
+
+        if not built:
+            await self.rebuild(guild_id)
+
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrevrank(self.key(guild_id), discord_id)
+                pipe.zcard(self.key(guild_id))
+
+                rank, size = await pipe.execute()
+
+        return size if rank is None else rank
+
+    async def check_drift(self, guild_id: int) -> int:
+        """
+        Compare a guilds sorted set to the database, rebuilding it if they
+        differ
+
+        Returns the amount of profiles whose score was wrong or missing
+        """
+
+        expected = await self.get_scores(guild_id)
+
+        entries = await self.redis.zrange(self.key(guild_id), 0, -1, withscores=True)
+        actual = {int(member): int(score) for member, score in entries}
+
+        drift = sum(
+            1
+            for discord_id in expected.keys() | actual.keys()
+            if expected.get(discord_id) != actual.get(discord_id)
+        )
+
+        if drift > 0:
+            logger.warning(
+                f"{self.name} leaderboard for guild {guild_id} drifted by {drift} profiles"
+            )
+            await self.rebuild(guild_id, expected)
+
+        return drift
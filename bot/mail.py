@@ -0,0 +1,170 @@
+import asyncio
+from contextlib import suppress
+import logging
+import smtplib
+import time
+
+
+logger = logging.getLogger("email")
+
+
+class SmtpPool:
+    """
+    A small pool of authenticated connections for a single sender account
+
+    smtplib is blocking, so every network call runs in the default executor.
+    Connections are only ever used by one send at a time. Without `starttls`
+    connections are plain and don't log in, which is only meant for local
+    test servers.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        size: int = 2,
+        idle_timeout: float = 240,
+        starttls: bool = True,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.idle_timeout = idle_timeout
+        self.starttls = starttls
+
+        self.slots = asyncio.Semaphore(size)
+        self.idle: list[tuple[smtplib.SMTP, float]] = []
+
+        # Set once the pool is replaced, connections that are in use are
+        # closed when their send finishes instead of being kept around
+        self.closed = False
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls()
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+
+        logger.info(f"opened smtp connection for {self.user}")
+
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        with suppress(smtplib.SMTPException, OSError):
+            server.quit()
+
+        server.close()
+
+    async def _acquire(self) -> smtplib.SMTP:
+        loop = asyncio.get_running_loop()
+
+        while self.idle:
+            server, last_used = self.idle.pop()
+
+            # Servers drop idle connections on their own, don't bother
+            # reusing ones that have been idle for too long
+            if time.monotonic() - last_used < self.idle_timeout:
+                return server
+
+            await loop.run_in_executor(None, self._close, server)
+
+        return await loop.run_in_executor(None, self._connect)
+
+    async def send(self, from_: str, to: str, message: str):
+        """Send a message, reusing an idle connection if there is one"""
+
+        loop = asyncio.get_running_loop()
+
+        async with self.slots:
+            server = await self._acquire()
+
+            try:
+                try:
+                    await loop.run_in_executor(
+                        None, server.sendmail, from_, to, message
+                    )
+                except smtplib.SMTPServerDisconnected:
+                    # The connection went stale in the meantime, retry once on
+                    # a fresh one
+                    server.close()
+                    server = await loop.run_in_executor(None, self._connect)
+                    await loop.run_in_executor(
+                        None, server.sendmail, from_, to, message
+                    )
+            except BaseException:
+                # Don't hand out connections in an unknown state
+                await loop.run_in_executor(None, self._close, server)
+                raise
+
+            if self.closed:
+                await loop.run_in_executor(None, self._close, server)
+            else:
+                self.idle.append((server, time.monotonic()))
+
+    async def close(self):
+        """Close all idle connections, and the ones in use once they are done"""
+
+        loop = asyncio.get_running_loop()
+
+        self.closed = True
+
+        idle, self.idle = self.idle, []
+        await asyncio.gather(
+            *(loop.run_in_executor(None, self._close, server) for server, _ in idle)
+        )
+
+
+class MailTransport:
+    """Sends mail without blocking the event loop, pooling connections per account"""
+
+    def __init__(
+        self,
+        host: str = "smtp.gmail.com",
+        port: int = 587,
+        pool_size: int = 2,
+        starttls: bool = True,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.starttls = starttls
+
+        self.pools: dict[str, SmtpPool] = {}
+
+    async def send(self, user: str, password: str, to: str, message: str):
+        """Send a message from an account"""
+
+        pool = self.pools.get(user)
+        if pool is None or pool.password != password:
+            # The password was changed, drop the connections that logged in
+            # with the old one
+            if pool is not None:
+                await pool.close()
+
+            pool = SmtpPool(
+                self.host,
+                self.port,
+                user,
+                password,
+                self.pool_size,
+                starttls=self.starttls,
+            )
+            self.pools[user] = pool
+
+        await pool.send(user, to, message)
+
+    async def close(self):
+        """Close all idle connections of all accounts"""
+
+        pools, self.pools = self.pools, {}
+        await asyncio.gather(*(pool.close() for pool in pools.values()))
@@ -0,0 +1,290 @@
+import asyncio
+from collections import deque, namedtuple
+import json
+import logging
+import smtplib
+import time
+from typing import Any
+import uuid
+
+from redis.asyncio import Redis
+
+from models.config import Config
+
+from bot.mail import MailTransport
+from bot.rate_limit import TokenBucket
+
+
+logger = logging.getLogger("email")
+
+
+EMAIL_MESSAGE = "From: {from_}\nTo: {to}\nSubject: {subject}\n\n{body}"
+
+QueueInfo = namedtuple(
+    "QueueInfo",
+    ["pending", "delayed", "dead", "sent", "retried", "average_latency", "max_latency"],
+)
+
+
+class PermanentFailure(Exception):
+    """A verification email that will never be sent, no matter how often it is retried"""
+
+
+class MailQueue:
+    """
+    Durable queue of verification emails
+
+    Emails are stored in Redis until they are sent, so none are lost when the
+    bot restarts. Workers send them at a limited rate per sender account,
+    failed sends are retried with exponential backoff and eventually moved to
+    a dead letter list. That list keeps the last `max_dead` jobs, without
+    their codes, and expires `dead_ttl` seconds after the last one was added.
+
+    Jobs only hold the guild, recipient and code, the rest of the email and
+    the account credentials are read from the guild config when it is sent.
+
+    Jobs that were being sent when the bot stopped are moved back into the
+    queue when it starts. This assumes a single bot instance runs the queue,
+    with more replicas one would requeue the jobs another is still sending.
+    """
+
+    pending_key = "mail_queue:pending"
+    processing_key = "mail_queue:processing"
+    delayed_key = "mail_queue:delayed"
+    dead_key = "mail_queue:dead"
+
+    def __init__(
+        self,
+        redis: Redis,
+        mail: MailTransport,
+        workers: int = 4,
+        rate: float = 0.5,
+        burst: int = 10,
+        max_attempts: int = 6,
+        base_delay: float = 30,
+        max_delay: float = 3600,
+        max_retry_delay: float = 60,
+        max_dead: int = 1000,
+        dead_ttl: int = 7 * 86400,
+    ) -> None:
+        self.redis = redis
+        self.mail = mail
+        self.workers = workers
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_dead = max_dead
+        self.dead_ttl = dead_ttl
+
+        self.buckets: dict[str, TokenBucket] = {}
+
+        self.sent = 0
+        self.retried = 0
+        self.latencies: deque[float] = deque(maxlen=256)
+
+    async def enqueue(self, guild_id: int, to: str, code: str):
+        """Queue a verification email"""
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "guild_id": guild_id,
+            "to": to,
+            "code": code,
+            "attempts": 0,
+            "enqueued_at": time.time(),
+        }
+
+        await self.redis.lpush(self.pending_key, json.dumps(job))
+
+        logger.info(f"queued email to {to}")
+
+    async def info(self) -> QueueInfo:
+        """Get the current size of the queue and recent send statistics"""
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.pending_key)
+            pipe.zcard(self.delayed_key)
+            pipe.llen(self.dead_key)
+
+            pending, delayed, dead = await pipe.execute()
+
+        latencies = list(self.latencies)
+
+        return QueueInfo(
+            pending,
+            delayed,
+            dead,
+            self.sent,
+            self.retried,
+            sum(latencies) / len(latencies) if latencies else 0,
+            max(latencies, default=0),
+        )
+
+    async def run(self, bot):
+        """Start sending queued emails, never returns"""
+
+        await self.retrying("requeueing interrupted emails", self.requeue_processing)
+
+        await asyncio.gather(
+            self.retrying("promoting delayed emails", self.promote_delayed),
+            *(
+                self.retrying("sending emails", self.work, bot)
+                for _ in range(self.workers)
+            ),
+        )
+
+    async def retrying(self, name: str, loop, *args):
+        """
+        Run `loop` until it returns, restarting it with exponential backoff
+        when it fails
+
+        Losing the connection to Redis must not stop the queue for good
+        """
+
+        delay = 1
+        while True:
+            started = time.monotonic()
+
+            try:
+                return await loop(*args)
+            except Exception:
+                # Only back off further if it keeps failing right away
+                if time.monotonic() - started > self.max_retry_delay:
+                    delay = 1
+
+                logger.exception(f"{name} failed, retrying in {delay}s")
+
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def requeue_processing(self):
+        """Move jobs that were being sent when the bot stopped back into the queue"""
+
+        while await self.redis.lmove(
+            self.processing_key, self.pending_key, "LEFT", "RIGHT"
+        ):
+            pass
+
+    async def promote_delayed(self):
+        """Move retries whose backoff has passed back into the queue"""
+
+        while True:
+            due = await self.redis.zrangebyscore(
+                self.delayed_key, 0, time.time(), start=0, num=100
+            )
+
+            if due:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.zrem(self.delayed_key, *due)
+                    pipe.rpush(self.pending_key, *due)
+
+                    await pipe.execute()
+            else:
+                await asyncio.sleep(1)
+
+    async def work(self, bot):
+        while True:
+            raw = await self.redis.blmove(
+                self.pending_key, self.processing_key, 5, "RIGHT", "LEFT"
+            )
+            if raw is None:
+                continue
+
+            try:
+                await self.process(bot, raw)
+            except Exception:
+                logger.exception(f"failed to process email job {raw}")
+
+    async def process(self, bot, raw: str):
+        job: dict[str, Any] = json.loads(raw)
+
+        try:
+            await self.send(job)
+        except PermanentFailure as e:
+            await self.bury(bot, raw, job, str(e))
+            return
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError) as e:
+            await self.bury(bot, raw, job, repr(e))
+            return
+        except Exception as e:
+            job["attempts"] += 1
+            if job["attempts"] >= self.max_attempts:
+                await self.bury(bot, raw, job, repr(e))
+                return
+
+            delay = min(self.base_delay * 2 ** (job["attempts"] - 1), self.max_delay)
+            logger.warning(
+                f"failed to send email to {job['to']} (attempt {job['attempts']}), retrying in {delay}s: {e!r}"
+            )
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(self.delayed_key, {json.dumps(job): time.time() + delay})
+                pipe.lrem(self.processing_key, 1, raw)
+
+                await pipe.execute()
+
+            self.retried += 1
+            return
+
+        await self.redis.lrem(self.processing_key, 1, raw)
+
+        latency = time.time() - job["enqueued_at"]
+        self.sent += 1
+        self.latencies.append(latency)
+
+        logger.info(f"sent email to {job['to']} after {latency:.1f}s")
+
+    async def send(self, job: dict[str, Any]):
+        guild_config = await Config.get(job["guild_id"])
+        if guild_config is None:
+            raise PermanentFailure(f"guild {job['guild_id']} has no config")
+
+        user = guild_config.verification_email_smtp_user
+        password = guild_config.verification_email_smtp_password
+        if user is None or password is None:
+            raise PermanentFailure(
+                f"guild {job['guild_id']} has no verification email account"
+            )
+
+        message = EMAIL_MESSAGE.format(
+            from_=user,
+            to=job["to"],
+            subject=guild_config.verification_email_subject,
+            body=guild_config.verification_email_body.format(code=job["code"]),
+        )
+
+        bucket = self.buckets.get(user)
+        if bucket is None:
+            bucket = self.buckets[user] = TokenBucket(self.rate, self.burst)
+
+        await bucket.acquire()
+        await self.mail.send(user, password, job["to"], message)
+
+    async def bury(self, bot, raw: str, job: dict[str, Any], reason: str):
+        """Give up on a job, moving it to the dead letter list"""
+
+        # The code is useless once the email is given up on and shouldn't
+        # linger in Redis
+        dead = {key: value for key, value in job.items() if key != "code"}
+        dead["reason"] = reason
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.dead_key, json.dumps(dead))
+            pipe.ltrim(self.dead_key, 0, self.max_dead - 1)
+            pipe.expire(self.dead_key, self.dead_ttl)
+            pipe.lrem(self.processing_key, 1, raw)
+
+            await pipe.execute()
+
+        logger.error(f"gave up on email to {job['to']}: {reason}")
+
+        guild = bot.get_guild(job["guild_id"])
+        if guild is not None:
+            bot.discord_logger.error(
+                f"gave up on sending a verification email to '{job['to']}': {reason}",
+                guild=guild,
+                log_type="verification",
+            )
@@ -0,0 +1,41 @@
+import time
+
+from redis.asyncio import Redis
+
+
+class MatchCooldown:
+    """
+    Remembers recent Freudr matches so the same pair can't match over and over
+
+    Every pair gets its own key, which expires once its cooldown is over
+    """
+
+    def __init__(self, redis: Redis, name: str = "freudr", ttl: int = 86400) -> None:
+        self.redis = redis
+        self.name = name
+        self.ttl = ttl
+
+    def key(self, user_id: int, crush_id: int) -> str:
+        """Get the key of a pair, which is the same in both directions"""
+
+        if user_id > crush_id:
+            user_id, crush_id = crush_id, user_id
+
+        return f"match_cooldown:{self.name}:{user_id}:{crush_id}"
+
+    async def start(self, user_id: int, crush_id: int) -> bool:
+        """
+        Start the cooldown of a pair, returns False if it was already cooling
+        down
+        """
+
+        started = await self.redis.set(
+            self.key(user_id, crush_id), int(time.time()), ex=self.ttl, nx=True
+        )
+
+        return bool(started)
+
+    async def is_cooling_down(self, user_id: int, crush_id: int) -> bool:
+        """Check if a pair matched within the cooldown"""
+
+        return await self.redis.exists(self.key(user_id, crush_id)) > 0
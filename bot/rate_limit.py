@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Allows `rate` actions per second on average, with bursts of up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        """Wait until an action is allowed"""
+
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Allow no actions for `seconds`, the bucket refills from then on"""
+
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+    def slow_down(self, rate: float):
+        """Lower the rate to `rate` if it is higher than that"""
+
+        self.rate = min(self.rate, rate)
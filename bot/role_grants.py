@@ -0,0 +1,142 @@
+import asyncio
+from enum import Enum
+import logging
+from typing import NamedTuple
+
+import discord
+from discord import Guild
+
+from bot.rate_limit import TokenBucket
+
+
+logger = logging.getLogger("role_grants")
+
+
+class RoleChange(NamedTuple):
+    guild: Guild
+    member_id: int
+    role_id: int
+    add: bool = True
+
+
+class RoleChangeResult(Enum):
+    DONE = "done"
+    UNCHANGED = "unchanged"
+    NOT_A_MEMBER = "not a member"
+    MISSING_ROLE = "missing role"
+    FORBIDDEN = "forbidden"
+    FAILED = "failed"
+
+    @property
+    def ok(self) -> bool:
+        return self in (RoleChangeResult.DONE, RoleChangeResult.UNCHANGED)
+
+
+def retry_after(error: discord.HTTPException) -> float:
+    """Get how long Discord asked to wait after a 429 response"""
+
+    headers = error.response.headers
+
+    return float(
+        headers.get("Retry-After") or headers.get("X-RateLimit-Reset-After") or 1
+    )
+
+
+def route_rate(error: discord.HTTPException) -> float | None:
+    """Get the rate a route allows per second from a 429 response, if it says"""
+
+    headers = error.response.headers
+    limit = headers.get("X-RateLimit-Limit")
+    reset_after = headers.get("X-RateLimit-Reset-After")
+    if limit is None or not reset_after or float(reset_after) <= 0:
+        return None
+
+    return int(limit) / float(reset_after)
+
+
+class RoleExecutor:
+    """
+    Adds and removes roles with a bounded amount of concurrent REST calls
+
+    Calls are also paced to `rate` per second per guild, the major parameter
+    of the member role routes, leaving room for everything else the bot is
+    doing. discord.py retries rate limited calls on its own, but if one still
+    ends in a 429 the guild's bucket is paused for as long as Discord asks,
+    slowed down to the rate the route advertises and the change is retried,
+    up to `max_attempts` times. Changes that are already in effect according
+    to the member cache don't cost a REST call at all.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        rate: float = 10,
+        burst: int = 10,
+        max_attempts: int = 3,
+    ) -> None:
+        self.slots = asyncio.Semaphore(concurrency)
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+
+        self.buckets: dict[int, TokenBucket] = {}
+
+    def bucket(self, guild_id: int) -> TokenBucket:
+        bucket = self.buckets.get(guild_id)
+        if bucket is None:
+            bucket = self.buckets[guild_id] = TokenBucket(self.rate, self.burst)
+
+        return bucket
+
+    async def apply(self, change: RoleChange) -> RoleChangeResult:
+        """Apply a single role change"""
+
+        member = change.guild.get_member(change.member_id)
+        if member is None:
+            return RoleChangeResult.NOT_A_MEMBER
+
+        role = change.guild.get_role(change.role_id)
+        if role is None:
+            return RoleChangeResult.MISSING_ROLE
+
+        if (member.get_role(role.id) is not None) == change.add:
+            return RoleChangeResult.UNCHANGED
+
+        bucket = self.bucket(change.guild.id)
+
+        for attempt in range(1, self.max_attempts + 1):
+            async with self.slots:
+                await bucket.acquire()
+
+                try:
+                    if change.add:
+                        await member.add_roles(role)
+                    else:
+                        await member.remove_roles(role)
+                except discord.Forbidden:
+                    return RoleChangeResult.FORBIDDEN
+                except discord.RateLimited as e:
+                    bucket.pause(e.retry_after)
+                except discord.HTTPException as e:
+                    if e.status != 429:
+                        logger.exception(
+                            f"failed to change role {role.id} of {member.id} in guild {change.guild.id}"
+                        )
+                        return RoleChangeResult.FAILED
+
+                    bucket.pause(retry_after(e))
+                    if (rate := route_rate(e)) is not None:
+                        bucket.slow_down(rate)
+                else:
+                    return RoleChangeResult.DONE
+
+            logger.warning(
+                f"rate limited changing roles in guild {change.guild.id}, attempt {attempt} of {self.max_attempts}"
+            )
+
+        return RoleChangeResult.FAILED
+
+    async def run(self, changes: list[RoleChange]) -> list[RoleChangeResult]:
+        """Apply multiple role changes, returns their results in order"""
+
+        return await asyncio.gather(*(self.apply(change) for change in changes))
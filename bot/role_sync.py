@@ -0,0 +1,353 @@
+import asyncio
+from contextlib import suppress
+import logging
+import time
+from typing import Iterable, NamedTuple, Optional
+
+import discord
+from discord import Guild, Message, Role
+from redis.asyncio import Redis
+from redis.exceptions import WatchError
+
+from models.profile import Profile
+
+from bot.role_grants import RoleChange, RoleChangeResult, RoleExecutor
+
+
+logger = logging.getLogger("role_sync")
+
+
+class RoleSyncJob(NamedTuple):
+    guild_id: int
+    title: str
+    role_id: int
+    remove_role_id: Optional[int]
+    channel_id: int
+    message_id: int
+    total: int
+    processed: int
+    updated: int
+    failed: int
+
+    def progress(self) -> str:
+        return f"{self.title}...\n{self.processed}/{self.total} role changes checked, {self.updated} made, {self.failed} failed"
+
+    def summary(self) -> str:
+        summary = (
+            f"{self.title}: {self.total} role changes checked, {self.updated} made"
+        )
+        if self.failed:
+            summary += f", {self.failed} failed"
+
+        return summary
+
+
+class RoleDiff(NamedTuple):
+    add: set[int]
+    remove: set[int]
+    unchanged: int
+    prune: bool
+
+    def __bool__(self) -> bool:
+        return bool(self.add or self.removals)
+
+    @property
+    def removals(self) -> set[int]:
+        """The stale holders that lose the role, none unless pruning"""
+
+        return self.remove if self.prune else set()
+
+    def summary(self) -> str:
+        stale = f"{len(self.remove)} members have it without being verified"
+        if self.remove and not self.prune:
+            stale += " and keep it"
+
+        return f"{len(self.add)} verified members are missing the role, {stale}, {self.unchanged} members are up to date"
+
+
+async def verified_role_diff(guild: Guild, role: Role, prune: bool = False) -> RoleDiff:
+    """
+    Compare the verified members of a guild with the members that have its
+    verified role
+
+    Both sides are taken from the member cache and the database as sets of
+    ids, no requests are made. Members that have the role without being
+    verified might have been given it by hand, they only lose it if `prune`
+    is set. Bots are never counted as stale holders.
+    """
+
+    verified = await Profile.find_verified_ids_in_guild(guild)
+    holders = {member.id for member in role.members if not member.bot}
+
+    return RoleDiff(
+        verified - holders, holders - verified, len(verified & holders), prune
+    )
+
+
+class RoleSync:
+    """
+    Adds and removes a role for a large amount of members in the background
+
+    Role changes go through the shared `RoleExecutor` in chunks of
+    `chunk_size`, so only a few requests ever wait on Discord's rate limit
+    bucket for the guild at once. After every chunk the members that were
+    handled are checkpointed in Redis, a job that was interrupted by a restart
+    picks up where it left off. The progress message is edited at most once
+    every `progress_interval` seconds.
+
+    A job that fails is retried up to `max_attempts` times, waiting twice as
+    long as the time before from `retry_delay` seconds on. After that it is
+    given up, so new jobs can be started in its guild.
+
+    Only one job can run per guild at a time.
+    """
+
+    jobs_key = "role_sync:jobs"
+
+    def __init__(
+        self,
+        redis: Redis,
+        executor: RoleExecutor,
+        chunk_size: int = 25,
+        progress_interval: float = 5,
+        max_attempts: int = 5,
+        retry_delay: float = 10,
+    ) -> None:
+        self.redis = redis
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.tasks: dict[int, asyncio.Task] = {}
+
+    @staticmethod
+    def key(guild_id: int) -> str:
+        return f"role_sync:{guild_id}"
+
+    @staticmethod
+    def add_key(guild_id: int) -> str:
+        return f"role_sync:{guild_id}:add"
+
+    @staticmethod
+    def remove_key(guild_id: int) -> str:
+        return f"role_sync:{guild_id}:remove"
+
+    async def start(
+        self,
+        bot,
+        guild: Guild,
+        title: str,
+        role_id: int,
+        message: Message,
+        add: Iterable[int] = (),
+        remove: Iterable[int] = (),
+        remove_role_id: Optional[int] = None,
+    ) -> bool:
+        """
+        Start a job giving `role_id` to the `add` members and taking
+        `remove_role_id` (or `role_id` if not given) from the `remove` members
+
+        `message` is edited to show the progress of the job. Returns False if
+        a job is already running in the guild.
+        """
+
+        add = set(add)
+        remove = set(remove)
+
+        # The job is its own lock, it is only written if the guild has none
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(self.key(guild.id))
+            if await pipe.exists(self.key(guild.id)):
+                return False
+
+            pipe.multi()
+            pipe.delete(self.add_key(guild.id), self.remove_key(guild.id))
+            pipe.hset(
+                self.key(guild.id),
+                mapping={
+                    "title": title,
+                    "role_id": role_id,
+                    "remove_role_id": remove_role_id or role_id,
+                    "channel_id": message.channel.id,
+                    "message_id": message.id,
+                    "total": len(add) + len(remove),
+                    "processed": 0,
+                    "updated": 0,
+                    "failed": 0,
+                },
+            )
+            pipe.sadd(self.jobs_key, guild.id)
+            if add:
+                pipe.sadd(self.add_key(guild.id), *add)
+            if remove:
+                pipe.sadd(self.remove_key(guild.id), *remove)
+
+            try:
+                await pipe.execute()
+            except WatchError:
+                # Another job was started in the meantime
+                return False
+
+        logger.info(
+            f"started role sync '{title}' in guild {guild.id}: {len(add)} to add, {len(remove)} to remove"
+        )
+
+        self._spawn(bot, guild.id)
+
+        return True
+
+    async def get(self, guild_id: int) -> Optional[RoleSyncJob]:
+        """Get the job that is running in a guild, if there is one"""
+
+        job = await self.redis.hgetall(self.key(guild_id))
+        if not job:
+            return None
+
+        return RoleSyncJob(
+            guild_id,
+            job["title"],
+            int(job["role_id"]),
+            int(job["remove_role_id"]),
+            int(job["channel_id"]),
+            int(job["message_id"]),
+            int(job["total"]),
+            int(job["processed"]),
+            int(job["updated"]),
+            int(job["failed"]),
+        )
+
+    async def resume(self, bot):
+        """Resume all jobs that were interrupted by a restart"""
+
+        for guild_id in await self.redis.smembers(self.jobs_key):
+            guild_id = int(guild_id)
+            if guild_id not in self.tasks:
+                logger.info(f"resuming role sync in guild {guild_id}")
+                self._spawn(bot, guild_id)
+
+    def _spawn(self, bot, guild_id: int):
+        task = asyncio.create_task(self._run(bot, guild_id))
+        self.tasks[guild_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(guild_id, None))
+
+    async def _run(self, bot, guild_id: int):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                return await self.run(bot, guild_id)
+            except Exception:
+                logger.exception(
+                    f"role sync in guild {guild_id} failed, attempt {attempt} of {self.max_attempts}"
+                )
+
+            if attempt < self.max_attempts:
+                # The checkpoint is kept, the retry picks up where it failed
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        try:
+            await self.give_up(bot, guild_id)
+        except Exception:
+            # The job is still there, it is retried on the next restart
+            logger.exception(f"failed to give up role sync in guild {guild_id}")
+
+    async def run(self, bot, guild_id: int):
+        """Work through a job until every member was handled"""
+
+        job = await self.get(guild_id)
+        guild = bot.get_guild(guild_id)
+        if job is None or guild is None:
+            logger.warning(f"dropping role sync in guild {guild_id}")
+            return await self.finish(guild_id)
+
+        last_progress = time.monotonic()
+
+        while True:
+            key, add = self.add_key(guild_id), True
+            member_ids = await self.redis.srandmember(key, self.chunk_size)
+            if not member_ids:
+                key, add = self.remove_key(guild_id), False
+                member_ids = await self.redis.srandmember(key, self.chunk_size)
+            if not member_ids:
+                break
+
+            changes = [
+                RoleChange(
+                    guild,
+                    int(member_id),
+                    job.role_id if add else job.remove_role_id,
+                    add,
+                )
+                for member_id in member_ids
+            ]
+            results = await self.executor.run(changes)
+
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.srem(key, *member_ids)
+                pipe.hincrby(self.key(guild_id), "processed", len(results))
+                pipe.hincrby(
+                    self.key(guild_id),
+                    "updated",
+                    results.count(RoleChangeResult.DONE),
+                )
+                pipe.hincrby(
+                    self.key(guild_id),
+                    "failed",
+                    sum(1 for result in results if not result.ok),
+                )
+
+                await pipe.execute()
+
+            if time.monotonic() - last_progress >= self.progress_interval:
+                job = await self.get(guild_id)
+                await self.edit_message(bot, job, job.progress())
+                last_progress = time.monotonic()
+
+        job = await self.get(guild_id)
+        await self.edit_message(bot, job, job.summary())
+        await self.finish(guild_id)
+
+        logger.info(
+            f"finished role sync '{job.title}' in guild {guild_id}: {job.updated} updated, {job.failed} failed"
+        )
+        bot.discord_logger.info(job.summary(), guild=guild)
+
+    async def give_up(self, bot, guild_id: int):
+        """Throw away a job that keeps failing and report how far it got"""
+
+        job = await self.get(guild_id)
+        await self.finish(guild_id)
+
+        if job is None:
+            return
+
+        summary = f"{job.title} failed after {job.processed}/{job.total} role changes were checked, {job.updated} made"
+
+        logger.warning(f"gave up role sync '{job.title}' in guild {guild_id}")
+        await self.edit_message(bot, job, summary)
+
+        guild = bot.get_guild(guild_id)
+        if guild is not None:
+            bot.discord_logger.error(summary, guild=guild)
+
+    async def edit_message(self, bot, job: RoleSyncJob, content: str):
+        message = bot.get_partial_messageable(job.channel_id).get_partial_message(
+            job.message_id
+        )
+
+        # The progress message might have been deleted in the meantime
+        with suppress(discord.HTTPException):
+            await message.edit(content=content)
+
+    async def finish(self, guild_id: int):
+        """Throw away a job"""
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(
+                self.key(guild_id), self.add_key(guild_id), self.remove_key(guild_id)
+            )
+            pipe.srem(self.jobs_key, guild_id)
+
+            await pipe.execute()
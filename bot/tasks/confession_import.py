@@ -0,0 +1,103 @@
+import logging
+
+import discord
+
+from models.config import Config
+from models.confession import Confession
+
+from bot.bot import Bot
+
+
+logger = logging.getLogger("confession_import")
+
+
+# Keys used before confessions were stored in the database, the counter
+# numbered confessions across all guilds and every key held the message a
+# confession was posted as
+COUNTER_KEY = "confessionid"
+KEY_PATTERN = "confession:*"
+
+
+async def seed_confession_ids(bot: Bot):
+    """Continue numbering confessions after the last one numbered in Redis"""
+
+    counter = await bot.redis.get(COUNTER_KEY)
+    if counter is None:
+        return
+
+    await Confession.advance_ids(int(counter))
+
+    logger.info(f"confession ids continue after #{counter}")
+
+
+async def import_confessions(bot: Bot):
+    """
+    Import the confessions that could still be replied to from Redis
+
+    Redis only knows the message of a confession, so its guild is found by
+    looking for the message in the confession channel of every guild.
+    Replies were posted in threads and couldn't be replied to themselves, so
+    they aren't found and aren't imported.
+    """
+
+    await bot.wait_until_ready()
+
+    keys = [key async for key in bot.redis.scan_iter(match=KEY_PATTERN)]
+    if not keys:
+        return
+
+    message_ids = await bot.redis.mget(keys)
+
+    configs = await Config.get_many([guild.id for guild in bot.guilds])
+    channels = [
+        channel
+        for guild in bot.guilds
+        if guild.id in configs
+        and configs[guild.id].confession_channel is not None
+        and (channel := guild.get_channel(configs[guild.id].confession_channel))
+        is not None
+    ]
+
+    rows = []
+    for key, message_id in zip(keys, message_ids):
+        if message_id is None:
+            continue
+
+        for channel in channels:
+            try:
+                message = await channel.fetch_message(int(message_id))
+            except (discord.NotFound, discord.Forbidden):
+                continue
+
+            rows.append(
+                {
+                    "id": int(key.removeprefix("confession:")),
+                    "guild_id": channel.guild.id,
+                    "message_id": message.id,
+                    # Threads created from a message share its id
+                    "thread_id": message.id if message.flags.has_thread else None,
+                }
+            )
+            break
+
+    await Confession.upsert_many(rows)
+
+    # The counter is kept, ids are seeded from it again on every start
+    await bot.redis.delete(*keys)
+
+    logger.info(f"imported {len(rows)} of {len(keys)} confessions from redis")
+
+
+async def import_confessions_safely(bot: Bot):
+    try:
+        await import_confessions(bot)
+    except Exception:
+        # The keys are kept, the import is retried on the next start
+        logger.exception("failed to import confessions from redis")
+
+
+async def setup(bot: Bot):
+    # Before the bot connects, so no confession gets a number that is in use
+    await seed_confession_ids(bot)
+
+    bot.loop.create_task(import_confessions_safely(bot))
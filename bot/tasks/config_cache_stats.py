@@ -0,0 +1,28 @@
+import asyncio
+import logging
+from bot.bot import Bot
+
+from models.config import Config
+
+
+logger = logging.getLogger("config_cache_stats")
+
+
+async def config_cache_stats():
+    while True:
+        await asyncio.sleep(3600)
+
+        try:
+            info = Config.cache_info()
+            lookups = info.hits + info.misses
+            hit_rate = info.hits / lookups if lookups else 0
+
+            logger.info(
+                f"{info.hits} hits, {info.misses} misses ({hit_rate:.1%} hit rate), {info.invalidations} invalidations, {info.size} configs cached"
+            )
+        except Exception:
+            logger.exception("failed to log config cache stats")
+
+
+async def setup(bot: Bot):
+    bot.loop.create_task(config_cache_stats())
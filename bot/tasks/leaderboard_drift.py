@@ -0,0 +1,26 @@
+import asyncio
+import logging
+from bot.bot import Bot
+
+
+logger = logging.getLogger("leaderboard_drift")
+
+
+async def leaderboard_drift(bot: Bot):
+    while True:
+        await asyncio.sleep(6 * 3600)
+
+        logger.info("checking leaderboards for drift...")
+        for guild in bot.guilds:
+            for leaderboard in bot.leaderboards:
+                try:
+                    await leaderboard.check_drift(guild.id)
+                except Exception:
+                    logger.exception(
+                        f"failed to check {leaderboard.name} leaderboard for guild {guild.id}"
+                    )
+        logger.info("done")
+
+
+async def setup(bot: Bot):
+    bot.loop.create_task(leaderboard_drift(bot))
@@ -0,0 +1,26 @@
+import asyncio
+import logging
+from bot.bot import Bot
+
+
+logger = logging.getLogger("mail_queue")
+
+
+async def mail_queue_stats(bot: Bot):
+    while True:
+        await asyncio.sleep(300)
+
+        try:
+            info = await bot.mail_queue.info()
+        except Exception:
+            logger.exception("failed to get mail queue stats")
+            continue
+
+        logger.info(
+            f"{info.pending} pending, {info.delayed} awaiting retry, {info.dead} dead, {info.sent} sent ({info.average_latency:.1f}s average, {info.max_latency:.1f}s max latency), {info.retried} retried"
+        )
+
+
+async def setup(bot: Bot):
+    bot.loop.create_task(bot.mail_queue.run(bot))
+    bot.loop.create_task(mail_queue_stats(bot))
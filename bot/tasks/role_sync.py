@@ -0,0 +1,11 @@
+from bot.bot import Bot
+
+
+async def resume_role_syncs(bot: Bot):
+    await bot.wait_until_ready()
+
+    await bot.role_sync.resume(bot)
+
+
+async def setup(bot: Bot):
+    bot.loop.create_task(resume_role_syncs(bot))
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+from models.profile import Profile
+
+from bot.bot import Bot
+
+
+logger = logging.getLogger("set_aside_cleanup")
+
+
+async def cleanup_set_aside(bot: Bot) -> bool:
+    """
+    Throw away the statistics and crushes that were set aside for pending
+    users once their verification is no longer pending
+
+    Returns whether anything is still set aside
+    """
+
+    discord_ids = list(await Profile.find_set_aside_ids())
+    if not discord_ids:
+        return False
+
+    async with bot.redis.pipeline(transaction=False) as pipe:
+        for discord_id in discord_ids:
+            pipe.exists(bot.verification_codes.key(discord_id))
+
+        pending = await pipe.execute()
+
+    abandoned = [
+        discord_id
+        for discord_id, is_pending in zip(discord_ids, pending)
+        if not is_pending
+    ]
+    if abandoned:
+        await Profile.drop_set_aside(abandoned)
+
+        logger.info(
+            f"dropped the set aside statistics and crushes of {len(abandoned)} users that never verified"
+        )
+
+    return len(abandoned) < len(discord_ids)
+
+
+async def set_aside_cleanup(bot: Bot):
+    # Users that still verify have their rows restored, the others' codes
+    # expire within a day
+    while True:
+        try:
+            if not await cleanup_set_aside(bot):
+                return
+        except Exception:
+            logger.exception("failed to clean up set aside statistics and crushes")
+
+        await asyncio.sleep(86400)
+
+
+async def setup(bot: Bot):
+    bot.loop.create_task(set_aside_cleanup(bot))
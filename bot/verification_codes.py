@@ -0,0 +1,109 @@
+from enum import Enum
+from typing import NamedTuple, Optional
+import uuid
+
+from redis.asyncio import Redis
+
+
+class PendingVerification(NamedTuple):
+    email: str
+    code: str
+    attempts: int
+
+
+class CodeCheck(Enum):
+    MATCH = "match"
+    MISMATCH = "mismatch"
+    EXPIRED = "expired"
+    TOO_MANY_ATTEMPTS = "too many attempts"
+
+
+class VerificationCodes:
+    """
+    Verification codes that were sent out but not used yet
+
+    Codes expire after `ttl` seconds, and are thrown away after
+    `max_attempts` wrong guesses
+    """
+
+    def __init__(self, redis: Redis, ttl: int = 86400, max_attempts: int = 5) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+
+    @staticmethod
+    def key(discord_id: int) -> str:
+        return f"verification:{discord_id}"
+
+    async def start(self, discord_id: int, email: str) -> str:
+        """
+        Create a new code for a user, replacing the one they might already
+        have
+        """
+
+        code = uuid.uuid4().hex
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key(discord_id))
+            pipe.hset(
+                self.key(discord_id),
+                mapping={"email": email, "code": code, "attempts": 0},
+            )
+            pipe.expire(self.key(discord_id), self.ttl)
+
+            await pipe.execute()
+
+        return code
+
+    async def get(self, discord_id: int) -> Optional[PendingVerification]:
+        """Get the pending verification of a user, if there is one"""
+
+        pending = await self.redis.hgetall(self.key(discord_id))
+        if not pending:
+            return None
+
+        return PendingVerification(
+            pending["email"], pending["code"], int(pending["attempts"])
+        )
+
+    async def check(
+        self, discord_id: int, code: str
+    ) -> tuple[CodeCheck, Optional[PendingVerification]]:
+        """
+        Check a code a user entered, counting it as an attempt
+
+        Returns the outcome together with the pending verification, if there
+        was one
+        """
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.exists(self.key(discord_id))
+            pipe.hincrby(self.key(discord_id), "attempts", 1)
+            pipe.hgetall(self.key(discord_id))
+
+            existed, _, pending = await pipe.execute()
+
+        if not existed:
+            # HINCRBY created a new key, don't leave it lying around
+            await self.redis.delete(self.key(discord_id))
+
+            return CodeCheck.EXPIRED, None
+
+        pending = PendingVerification(
+            pending["email"], pending["code"], int(pending["attempts"])
+        )
+
+        if pending.attempts > self.max_attempts:
+            await self.finish(discord_id)
+
+            return CodeCheck.TOO_MANY_ATTEMPTS, pending
+
+        if code != pending.code:
+            return CodeCheck.MISMATCH, pending
+
+        return CodeCheck.MATCH, pending
+
+    async def finish(self, discord_id: int):
+        """Throw away the pending verification of a user"""
+
+        await self.redis.delete(self.key(discord_id))
@@ -5,5 +5,5 @@ select
 from
 	profile, config
 where
-	profile.email is not null and profile.confirmation_code is null
+	profile.email is not null
 on conflict do nothing;
@@ -1,7 +1,12 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 import logging
 import os
+from typing import Any, AsyncIterator, Optional
 
-from sqlalchemy import Column, select
+from sqlalchemy import Column, ColumnElement, delete, exists, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Query
@@ -19,23 +24,189 @@ Base = declarative_base()
 logger.info("database connected")
 
 
+class UnitOfWork:
+    """A session shared by every model call made within a `unit_of_work` block"""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+        # Sessions can't be used concurrently, so calls made from gathered
+        # coroutines take turns
+        self.lock = asyncio.Lock()
+
+
+current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar(
+    "current_unit_of_work", default=None
+)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    Run all model calls made within this context in a single session
+
+    Changes are committed once when the context exits, or rolled back if it
+    exits with an exception. Nested units of work join the outer one.
+    """
+
+    if current_unit_of_work.get() is not None:
+        yield current_unit_of_work.get().session
+        return
+
+    async with session_factory() as session:
+        uow = UnitOfWork(session)
+        token = current_unit_of_work.set(uow)
+
+        try:
+            yield session
+
+            async with uow.lock:
+                await session.commit()
+        finally:
+            current_unit_of_work.reset(token)
+
+
+@asynccontextmanager
+async def get_session() -> AsyncIterator[AsyncSession]:
+    """
+    Get the session of the current unit of work, or a new session if there is
+    no unit of work
+
+    Model methods must not nest these, the unit of work session is locked
+    while in use
+    """
+
+    uow = current_unit_of_work.get()
+    if uow is None:
+        async with session_factory() as session:
+            yield session
+
+        return
+
+    async with uow.lock:
+        yield uow.session
+
+
+async def commit(session: AsyncSession):
+    """
+    Commit a session
+
+    Sessions belonging to a unit of work are only flushed, they will be
+    committed when the unit of work ends
+    """
+
+    uow = current_unit_of_work.get()
+    if uow is not None and uow.session is session:
+        await session.flush()
+    else:
+        await session.commit()
+
+
 class Model:
     @classmethod
     async def create(cls, **kwargs) -> "Model":
         """Create a new row"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             instance = cls(**kwargs)
             session.add(instance)
-            await session.commit()
+            await commit(session)
+
+            return instance
+
+    @classmethod
+    async def get_or_insert(cls, **kwargs) -> "Model":
+        """
+        Find a row given its primary key, or create a new row if it does not
+        exist
+
+        Both happen in a single statement, so concurrent callers can't create
+        the same row twice
+        """
+
+        table = cls.__table__
+
+        inserted = (
+            pg_insert(cls)
+            .values(**kwargs)
+            .on_conflict_do_nothing()
+            .returning(*table.columns)
+            .cte("inserted")
+        )
+        existing = (
+            select(*table.columns).filter_by(**kwargs).where(~exists(select(inserted)))
+        )
+
+        async with get_session() as session:
+            result: Query = await session.execute(
+                select(cls).from_statement(union_all(select(inserted), existing))
+            )
+
+            instance = result.scalar_one_or_none()
+            if instance is None:
+                # A concurrent insert committed after this statement started,
+                # it is visible to the next one
+                result = await session.execute(select(cls).filter_by(**kwargs))
+                instance = result.scalar_one()
+
+            await commit(session)
 
             return instance
 
+    @classmethod
+    async def upsert_many(
+        cls,
+        rows: list[dict[str, Any]],
+        update_cols: Optional[list[str]] = None,
+        batch_size: int = 1000,
+    ):
+        """
+        Create new rows, using one statement per batch of `batch_size` rows
+
+        Rows whose primary key already exists have their `update_cols` updated,
+        or are left as is if no columns are given
+        """
+
+        if not rows:
+            return
+
+        primary_key = list(cls.__table__.primary_key.columns)
+
+        async with get_session() as session:
+            for i in range(0, len(rows), batch_size):
+                stmt = pg_insert(cls).values(rows[i : i + batch_size])
+
+                if update_cols:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=primary_key,
+                        set_={col: stmt.excluded[col] for col in update_cols},
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=primary_key)
+
+                await session.execute(stmt)
+
+            await commit(session)
+
+    @classmethod
+    async def delete_where(cls, *criteria: ColumnElement[bool]) -> list["Model"]:
+        """Delete all rows matching the given criteria and return them"""
+
+        async with get_session() as session:
+            result: Query = await session.execute(
+                delete(cls).where(*criteria).returning(cls)
+            )
+            deleted = result.scalars().all()
+
+            await commit(session)
+
+            return deleted
+
     @classmethod
     async def get_all(cls) -> list["Model"]:
         """Get all rows"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Query = await session.execute(select(cls))
 
             return result.scalars().all()
@@ -49,13 +220,13 @@ class Model:
     async def save(self):
         """Save an updated row"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             session.add(self)
-            await session.commit()
+            await commit(session)
 
     async def delete(self):
         """Delete a row"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             await session.delete(self)
-            await session.commit()
+            await commit(session)
@@ -0,0 +1,132 @@
+from typing import Optional
+
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    Sequence,
+    func,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Result
+from sqlalchemy.schema import FetchedValue
+
+from models import Base, Model, commit, get_session
+
+
+confession_id_seq = Sequence("confession_id_seq")
+
+
+class Confession(Base, Model):
+    __tablename__ = "confession"
+
+    id = Column(BigInteger, confession_id_seq, primary_key=True)
+    guild_id = Column(BigInteger, ForeignKey("config.guild_id"), nullable=False)
+    message_id = Column(BigInteger, nullable=False, unique=True)
+    thread_id = Column(BigInteger)
+    parent_id = Column(BigInteger, ForeignKey("confession.id"))
+    created_at = Column(DateTime(timezone=True), FetchedValue(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"Confession(id={self.id}, guild_id={self.guild_id}, message_id={self.message_id}, thread_id={self.thread_id}, parent_id={self.parent_id})"
+
+    @classmethod
+    async def allocate(
+        cls, reply: Optional[int] = None
+    ) -> tuple[int, Optional["Confession"]]:
+        """
+        Allocate a new confession id
+
+        If the confession replies to another one, that confession is looked up
+        in the same statement. Returns the new id and the confession replied
+        to, if it exists.
+        """
+
+        async with get_session() as session:
+            if reply is None:
+                result: Result = await session.execute(
+                    select(confession_id_seq.next_value())
+                )
+
+                return result.scalar_one(), None
+
+            # The outer join keeps the row even if there is nothing to reply to
+            result: Result = await session.execute(
+                select(confession_id_seq.next_value(), cls)
+                .select_from(select(None).subquery())
+                .outerjoin(cls, cls.id == reply)
+            )
+
+            return tuple(result.one())
+
+    @classmethod
+    async def advance_ids(cls, past: int):
+        """Make sure newly allocated ids come after `past`"""
+
+        async with get_session() as session:
+            # Only ever move the sequence forward
+            await session.execute(
+                select(func.setval(confession_id_seq.name, past)).where(
+                    text(
+                        "(select case when is_called then last_value + 1 else last_value end from confession_id_seq) <= :past"
+                    ).bindparams(past=past)
+                )
+            )
+
+            await commit(session)
+
+    @classmethod
+    async def find(cls, confession_id: int) -> Optional["Confession"]:
+        """Find a confession given its id"""
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls).where(cls.id == confession_id)
+            )
+
+            return result.scalar_one_or_none()
+
+    @classmethod
+    async def find_many(cls, confession_ids: list[int]) -> dict[int, "Confession"]:
+        """Find multiple confessions given their ids, missing ids are left out"""
+
+        if not confession_ids:
+            return {}
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls).where(cls.id.in_(confession_ids))
+            )
+
+            return {confession.id: confession for confession in result.scalars()}
+
+    @classmethod
+    async def record(
+        cls,
+        confession_id: int,
+        guild_id: int,
+        message_id: int,
+        parent_id: Optional[int] = None,
+    ) -> "Confession":
+        """Remember the message an approved confession was posted as"""
+
+        return await cls.create(
+            id=confession_id,
+            guild_id=guild_id,
+            message_id=message_id,
+            parent_id=parent_id,
+        )
+
+    @classmethod
+    async def set_thread(cls, confession_id: int, thread_id: int):
+        """Remember the thread replies to a confession are posted in"""
+
+        async with get_session() as session:
+            await session.execute(
+                update(cls).where(cls.id == confession_id).values(thread_id=thread_id)
+            )
+
+            await commit(session)
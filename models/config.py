@@ -1,19 +1,189 @@
+import asyncio
+from collections import namedtuple
+from contextlib import suppress
 import logging
-from typing import Optional
+from typing import Any, Optional
 
+from asyncpg import Connection
 from sqlalchemy import Column, BigInteger, Integer, Text, select
 from sqlalchemy.engine import Result
+from sqlalchemy.ext.asyncio import AsyncConnection
 from sqlalchemy.schema import FetchedValue
-from sqlalchemy.orm import validates
+from sqlalchemy.orm import validates, make_transient_to_detached
 
 from discord import Guild
 
-from models import Base, Model, session_factory
+from models import Base, Model, current_unit_of_work, engine, get_session
 
 
 logger = logging.getLogger("models")
 
 
+CONFIG_CHANGED_CHANNEL = "config_changed"
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "invalidations", "size"])
+
+
+class ConfigCache:
+    """
+    In-process cache of guild configs
+
+    The cache is only used while it is listening for change notifications from
+    the database, this way edits made by other processes (eg. the web config)
+    are picked up immediately. When it is not listening every lookup goes
+    straight to the database. If the listening connection is lost it is
+    reconnected with exponential backoff.
+    """
+
+    def __init__(self, max_reconnect_delay: float = 60) -> None:
+        self.rows: dict[int, dict[str, Any]] = {}
+        self.connection: Optional[AsyncConnection] = None
+        self.max_reconnect_delay = max_reconnect_delay
+
+        # Whether the cache should be listening, the listener is reconnected
+        # while this is set
+        self.listening = False
+        self.reconnect_task: Optional[asyncio.Task] = None
+
+        # Bumped on every invalidation so lookups that were already in flight
+        # don't store stale rows
+        self.generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.connection is not None
+
+    def get(self, guild_id: int) -> Optional[dict[str, Any]]:
+        """Get the cached row for a guild, if there is one"""
+
+        if not self.enabled:
+            return None
+
+        row = self.rows.get(guild_id)
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return row
+
+    def store(self, row: dict[str, Any], generation: int):
+        """
+        Store a row, unless it was invalidated since `generation`
+
+        Rows read inside a unit of work are never stored, they might not be
+        committed yet and no notification is sent if they are rolled back
+        """
+
+        if not self.enabled or generation != self.generation:
+            return
+        if current_unit_of_work.get() is not None:
+            return
+
+        self.rows[row["guild_id"]] = row
+
+    def invalidate(self, guild_id: int):
+        """Drop the cached row for a guild"""
+
+        self.generation += 1
+        self.invalidations += 1
+        self.rows.pop(guild_id, None)
+
+    def clear(self):
+        """Drop all cached rows"""
+
+        self.generation += 1
+        self.rows.clear()
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.invalidations, len(self.rows))
+
+    async def listen(self):
+        """Start listening for config changes, enabling the cache"""
+
+        self.listening = True
+
+        if self.enabled:
+            return
+
+        connection = await engine.connect()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection: Connection = raw_connection.driver_connection
+
+        await driver_connection.add_listener(CONFIG_CHANGED_CHANNEL, self._on_notify)
+        driver_connection.add_termination_listener(self._on_terminate)
+
+        self.clear()
+        self.connection = connection
+
+        logger.info("listening for config changes")
+
+    async def stop(self):
+        """Stop listening for config changes, disabling the cache"""
+
+        self.listening = False
+
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+
+        if not self.enabled:
+            return
+
+        connection = self.connection
+        self.connection = None
+        self.clear()
+
+        await connection.close()
+
+    def _on_notify(self, _conn: Connection, _pid: int, _channel: str, payload: str):
+        self.invalidate(int(payload))
+
+    def _on_terminate(self, _conn: Connection):
+        if self.connection is None:
+            # Closed by `stop`
+            return
+
+        logger.warning("config listener connection lost, disabling config cache")
+
+        connection = self.connection
+        self.connection = None
+        self.clear()
+
+        if self.listening and self.reconnect_task is None:
+            self.reconnect_task = asyncio.get_running_loop().create_task(
+                self._reconnect(connection)
+            )
+
+    async def _reconnect(self, lost: AsyncConnection):
+        """Keep trying to listen again, backing off exponentially"""
+
+        with suppress(Exception):
+            await lost.invalidate()
+
+        delay = 1
+        try:
+            while self.listening and not self.enabled:
+                await asyncio.sleep(delay)
+
+                try:
+                    await self.listen()
+                except Exception as e:
+                    delay = min(delay * 2, self.max_reconnect_delay)
+                    logger.warning(
+                        f"failed to reconnect config listener, retrying in {delay}s: {e!r}"
+                    )
+        finally:
+            self.reconnect_task = None
+
+
+cache = ConfigCache()
+
+
 class Config(Base, Model):
     __tablename__ = "config"
 
@@ -49,11 +219,31 @@ class Config(Base, Model):
 
         return value
 
+    @classmethod
+    def _from_row(cls, row: dict[str, Any]) -> "Config":
+        """Build a detached config from a cached row"""
+
+        # Every caller gets its own instance so they can be modified and saved
+        # independently
+        instance = cls(**row)
+        make_transient_to_detached(instance)
+
+        return instance
+
+    def _to_row(self) -> dict[str, Any]:
+        return {col.name: getattr(self, col.name) for col in self.cols()}
+
     @classmethod
     async def get(cls, guild_id: int) -> Optional["Config"]:
         """Find a config given its guild ID"""
 
-        async with session_factory() as session:
+        row = cache.get(guild_id)
+        if row is not None:
+            return cls._from_row(row)
+
+        generation = cache.generation
+
+        async with get_session() as session:
             result: Result = await session.execute(
                 select(cls).where(cls.guild_id == guild_id)
             )
@@ -62,22 +252,88 @@ class Config(Base, Model):
             if r is None:
                 return None
 
+            cache.store(r[0]._to_row(), generation)
+
             return r[0]
 
+    @classmethod
+    async def get_many(cls, guild_ids: list[int]) -> dict[int, "Config"]:
+        """
+        Find the configs of multiple guilds, guilds without a config are left
+        out
+
+        Configs that aren't cached are looked up in a single query
+        """
+
+        configs = {}
+        missing = []
+        for guild_id in guild_ids:
+            row = cache.get(guild_id)
+            if row is None:
+                missing.append(guild_id)
+            else:
+                configs[guild_id] = cls._from_row(row)
+
+        if not missing:
+            return configs
+
+        generation = cache.generation
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls).where(cls.guild_id.in_(missing))
+            )
+
+            for config in result.scalars():
+                cache.store(config._to_row(), generation)
+                configs[config.guild_id] = config
+
+        return configs
+
     @classmethod
     async def get_or_create(cls, guild: Guild) -> "Config":
         """Find a config given its guild ID, or create an empty config if it does not exist"""
 
-        async with session_factory() as session:
+        config = await cls.get(guild.id)
+        if config is None:
+            return await cls.get_or_insert(guild_id=guild.id)
+
+        return config
+
+    @classmethod
+    async def warm_cache(cls, guild_ids: list[int]):
+        """Load the configs for all of the given guilds into the cache"""
+
+        generation = cache.generation
+
+        async with get_session() as session:
             result: Result = await session.execute(
-                select(cls).where(cls.guild_id == guild.id)
+                select(cls).where(cls.guild_id.in_(guild_ids))
             )
 
-            r = result.first()
-            if r is None:
-                return await Config.create(guild_id=guild.id)
+            configs: list["Config"] = result.scalars().all()
 
-            return r[0]
+        for config in configs:
+            cache.store(config._to_row(), generation)
+
+        logger.info(f"warmed config cache with {len(configs)} configs")
+
+    @staticmethod
+    def cache_info() -> CacheInfo:
+        """Get the config cache hit/miss counters"""
+
+        return cache.info()
+
+    async def save(self):
+        await super().save()
+
+        # Don't wait for the notification to arrive
+        cache.invalidate(self.guild_id)
+
+    async def delete(self):
+        await super().delete()
+
+        cache.invalidate(self.guild_id)
 
     def update(self, changes: dict[str, any]) -> "Config":
         """Update a config given a dict of changes"""
@@ -0,0 +1,118 @@
+from typing import Optional
+
+from sqlalchemy import (
+    Column,
+    BigInteger,
+    DateTime,
+    ForeignKey,
+    delete,
+    exists,
+    func,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Result
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import FetchedValue
+
+from models import Base, Model, commit, get_session
+from models.profile import Profile
+
+
+class Crush(Base, Model):
+    __tablename__ = "crush"
+
+    from_id = Column(BigInteger, ForeignKey("profile.discord_id"), primary_key=True)
+    to_id = Column(BigInteger, ForeignKey("profile.discord_id"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), FetchedValue(), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"Crush(from_id={self.from_id}, to_id={self.to_id}, created_at={self.created_at})"
+
+    @classmethod
+    async def like(cls, from_id: int, to_id: int) -> Optional[tuple[bool, bool]]:
+        """
+        Add a crush on a verified profile in a single statement
+
+        The pair is locked for the rest of the transaction first, two users
+        that like each other at the same time would otherwise both miss the
+        other's uncommitted crush. Returns whether the crush was added and
+        whether it is now mutual, or None if the crush is not a verified
+        profile
+        """
+
+        pair = f"crush:{min(from_id, to_id)}:{max(from_id, to_id)}"
+
+        target = (
+            select(Profile.discord_id).where(Profile.discord_id == to_id).cte("target")
+        )
+        inserted = (
+            insert(cls)
+            .from_select(
+                [cls.from_id, cls.to_id],
+                select(literal(from_id, BigInteger), target.c.discord_id),
+            )
+            .on_conflict_do_nothing()
+            .returning(cls.to_id)
+            .cte("inserted")
+        )
+
+        async with get_session() as session:
+            await session.execute(
+                select(func.pg_advisory_xact_lock(func.hashtextextended(pair, 0)))
+            )
+
+            result: Result = await session.execute(
+                select(
+                    exists(select(target)),
+                    exists(select(inserted)),
+                    exists().where(cls.from_id == to_id, cls.to_id == from_id),
+                )
+            )
+
+            verified, added, mutual = result.one()
+            await commit(session)
+
+            if not verified:
+                return None
+
+            return added, mutual
+
+    @classmethod
+    async def remove(cls, from_id: int, to_id: int) -> bool:
+        """Remove a crush, returns False if it did not exist"""
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                delete(cls)
+                .where(cls.from_id == from_id, cls.to_id == to_id)
+                .returning(cls.from_id)
+            )
+
+            removed = result.first() is not None
+            await commit(session)
+
+            return removed
+
+    @classmethod
+    async def find_for(cls, from_id: int) -> list[tuple[int, bool]]:
+        """
+        Find all crushes of a profile, together with whether or not the crush
+        is mutual
+        """
+
+        reverse = aliased(cls)
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls.to_id, reverse.from_id.is_not(None))
+                .outerjoin(
+                    reverse,
+                    (reverse.from_id == cls.to_id) & (reverse.to_id == cls.from_id),
+                )
+                .where(cls.from_id == from_id)
+                .order_by(cls.created_at)
+            )
+
+            return result.tuples().all()
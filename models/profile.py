@@ -1,41 +1,94 @@
-from typing import Optional
+import asyncio
+from contextvars import ContextVar
+from typing import Iterable, Optional
 
 from discord import Guild
-from sqlalchemy import Column, Text, BigInteger, select
+from sqlalchemy import (
+    Column,
+    Text,
+    BigInteger,
+    any_,
+    bindparam,
+    exists,
+    select,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.engine import Result
-from sqlalchemy.schema import FetchedValue
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.ext.mutable import Mutable
 
-from models import Base, Model, session_factory
-from models.profile_statistics import ProfileStatistics
+from models import Base, Model, commit, current_unit_of_work, get_session
 
 
-class MutableList(Mutable, list):
-    @classmethod
-    def coerce(cls, key, value):
-        if not isinstance(value, MutableList):
-            if isinstance(value, list):
-                return MutableList(value)
-            return Mutable.coerce(key, value)
-        else:
-            return value
-
-    def __setitem__(self, key, value):
-        list.__setitem__(self, key, value)
-        self.changed()
-
-    def __delitem__(self, key):
-        list.__delitem__(self, key)
-        self.changed()
+# Left behind by the migration that moved pending verifications to Redis
+RESTORE_PENDING_STATISTICS = text(
+    """
+    with restored as (
+        delete from pending_profile_statistics
+        where profile_discord_id = :id
+        returning *
+    )
+    insert into profile_statistics (
+        profile_discord_id,
+        config_guild_id,
+        freudpoints,
+        spendable_freudpoints,
+        confession_exposed_count,
+        last_accrued_on
+    )
+    select
+        profile_discord_id,
+        config_guild_id,
+        freudpoints,
+        spendable_freudpoints,
+        confession_exposed_count,
+        last_accrued_on
+    from restored
+    where exists (select from config where config.guild_id = restored.config_guild_id)
+    on conflict do nothing
+    """
+)
+
+# Crushes on users that are still pending are kept until they verify as well
+RESTORE_PENDING_CRUSHES = text(
+    """
+    with restored as (
+        delete from pending_crush
+        where :id in (from_id, to_id)
+            and exists (
+                select from profile
+                where profile.discord_id = case
+                    when pending_crush.from_id = :id then pending_crush.to_id
+                    else pending_crush.from_id
+                end
+            )
+        returning from_id, to_id, created_at
+    )
+    insert into crush (from_id, to_id, created_at)
+    select from_id, to_id, created_at from restored
+    on conflict do nothing
+    """
+)
+
+# The users whose statistics or crushes are still set aside
+FIND_SET_ASIDE_IDS = text(
+    """
+    select profile_discord_id from pending_profile_statistics
+    union
+    select ends.discord_id
+    from pending_crush, unnest(array[from_id, to_id]) as ends(discord_id)
+    where not exists (
+        select from profile where profile.discord_id = ends.discord_id
+    )
+    """
+)
 
-    def append(self, value):
-        list.append(self, value)
-        self.changed()
+DROP_SET_ASIDE_STATISTICS = text(
+    "delete from pending_profile_statistics where profile_discord_id = any(:ids)"
+).bindparams(bindparam("ids", type_=ARRAY(BigInteger)))
 
-    def remove(self, value):
-        list.remove(self, value)
-        self.changed()
+DROP_SET_ASIDE_CRUSHES = text(
+    "delete from pending_crush where from_id = any(:ids) or to_id = any(:ids)"
+).bindparams(bindparam("ids", type_=ARRAY(BigInteger)))
 
 
 class Profile(Base, Model):
@@ -43,44 +96,127 @@ class Profile(Base, Model):
 
     discord_id = Column(BigInteger, primary_key=True)
     email = Column(Text, unique=True, nullable=False)
-    confirmation_code = Column(Text, unique=True)
-    crushes = Column(
-        MutableList.as_mutable(ARRAY(BigInteger)), FetchedValue(), nullable=False
-    )
 
     def __repr__(self) -> str:
-        return f"Profile(discord_id={self.discord_id}, email={self.email}, confirmation_code={self.confirmation_code}), crushes={self.crushes}"
+        return f"Profile(discord_id={self.discord_id}, email={self.email})"
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Profile):
             return NotImplemented
 
-        return (
-            self.discord_id == other.discord_id
-            and self.email == other.email
-            and self.confirmation_code == other.confirmation_code
-        )
+        return self.discord_id == other.discord_id and self.email == other.email
 
     @classmethod
     async def find_by_discord_id(cls, discord_id: int) -> Optional["Profile"]:
-        """Find a profile given its discord_id"""
+        """
+        Find a profile given its discord_id
 
-        async with session_factory() as session:
+        Within an interaction, lookups made during the same event loop tick
+        are batched into a single query by the interaction's `ProfileLoader`
+        """
+
+        loader = current_profile_loader.get()
+        if loader is not None and current_unit_of_work.get() is None:
+            return await loader.load(discord_id)
+
+        # The unit of work might hold changes the loader's own session can't
+        # see yet
+        async with get_session() as session:
             result: Result = await session.execute(
                 select(cls).where(cls.discord_id == discord_id)
             )
 
-            r = result.first()
-            if r is None:
-                return None
+            return result.scalar_one_or_none()
 
-            return r[0]
+    @classmethod
+    async def find_by_discord_ids(cls, discord_ids: Iterable[int]) -> list["Profile"]:
+        """Find all profiles with one of the given discord_ids"""
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls).where(
+                    cls.discord_id
+                    == any_(
+                        bindparam("ids", list(discord_ids), type_=ARRAY(BigInteger))
+                    )
+                )
+            )
+
+            return result.scalars().all()
+
+    @classmethod
+    async def is_discord_id_verified(cls, discord_id: int) -> bool:
+        """
+        Check if the profile with a given discord_id exists
+
+        Profiles are only created once they are verified, pending
+        verifications are kept in Redis
+        """
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(exists().where(cls.discord_id == discord_id))
+            )
+
+            return result.scalar_one()
+
+    @classmethod
+    async def create_verified(cls, discord_id: int, email: str) -> Optional["Profile"]:
+        """
+        Create the profile of a user that just verified their email
+
+        Statistics and crushes that were set aside when the user's
+        verification was moved to Redis are restored along with it. Returns
+        None if the discord_id or email is already in use
+        """
+
+        async with get_session() as session:
+            result: Result = await session.execute(
+                select(cls).from_statement(
+                    insert(cls)
+                    .values(discord_id=discord_id, email=email)
+                    .on_conflict_do_nothing()
+                    .returning(cls)
+                )
+            )
+            profile = result.scalar_one_or_none()
+
+            if profile is not None:
+                await session.execute(RESTORE_PENDING_STATISTICS, {"id": discord_id})
+                await session.execute(RESTORE_PENDING_CRUSHES, {"id": discord_id})
+
+            await commit(session)
+
+            return profile
+
+    @classmethod
+    async def find_set_aside_ids(cls) -> set[int]:
+        """
+        Find the users that were pending when verifications were moved to
+        Redis and still have statistics or crushes set aside
+        """
+
+        async with get_session() as session:
+            result: Result = await session.execute(FIND_SET_ASIDE_IDS)
+
+            return set(result.scalars())
+
+    @classmethod
+    async def drop_set_aside(cls, discord_ids: Iterable[int]):
+        """Throw away the set aside statistics and crushes of users"""
+
+        discord_ids = list(discord_ids)
+
+        async with get_session() as session:
+            await session.execute(DROP_SET_ASIDE_STATISTICS, {"ids": discord_ids})
+            await session.execute(DROP_SET_ASIDE_CRUSHES, {"ids": discord_ids})
+            await commit(session)
 
     @classmethod
     async def find_by_email(cls, email: str) -> Optional["Profile"]:
         """Find a profile given its email"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Result = await session.execute(
                 select(cls).where(cls.email == email)
             )
@@ -92,39 +228,122 @@ class Profile(Base, Model):
             return r[0]
 
     @classmethod
-    async def find_verified_in_guild(cls, guild: Guild) -> list["Profile"]:
-        """Find all profiles in a specific guild that are verified"""
+    async def find_verified_ids_in_guild(cls, guild: Guild) -> set[int]:
+        """
+        Find the discord_ids of all members of a guild that have a profile
+
+        Only the ids are loaded, the members are taken from the member cache
+        """
+
+        member_ids = [member.id for member in guild.members]
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Result = await session.execute(
-                select(cls).where(
-                    cls.confirmation_code.is_(None), cls.email.is_not(None)
+                select(cls.discord_id).where(
+                    cls.discord_id
+                    == any_(bindparam("ids", member_ids, type_=ARRAY(BigInteger)))
                 )
             )
 
-            profiles: list["Profile"] = result.scalars().all()
+            return set(result.scalars())
 
-        profiles = filter(
-            lambda p: guild.get_member(p.discord_id) is not None, profiles
-        )
-        return list(profiles)
+    def is_verified(self) -> bool:
+        """Check if a profile is verified"""
 
-    async def get_freudpoint_rank(self, guild_id: int) -> int:
-        """Get a profiles FreudPoint score rank in a given guild"""
+        return self.email is not None
 
-        async with session_factory() as session:
-            query: Result = await session.execute(
-                select(Profile)
-                .join(ProfileStatistics)
-                .where(ProfileStatistics.config_guild_id == guild_id)
-                .order_by(ProfileStatistics.freudpoints.desc())
-            )
 
-        profiles: list["Profile"] = query.scalars().all()
+class ProfileLoader:
+    """
+    Batches and remembers `Profile.find_by_discord_id` lookups
 
-        return profiles.index(self)
+    Every lookup requested during one event loop tick is resolved by a single
+    `discord_id = ANY(...)` query, and every id is only fetched once during
+    the loader's lifetime. A loader belongs to a single interaction, see
+    `use_profile_loader`.
+    """
 
-    def is_verified(self) -> bool:
-        """Check if a profile is verified"""
+    def __init__(self) -> None:
+        self.memo: dict[int, asyncio.Future] = {}
+        self.batch: dict[int, asyncio.Future] = {}
+
+        # The event loop only keeps weak references to its tasks
+        self.tasks: set[asyncio.Task] = set()
+
+    async def load(self, discord_id: int) -> Optional[Profile]:
+        """Find a profile given its discord_id"""
+
+        future = self.memo.get(discord_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self.batch:
+                loop.call_soon(self.dispatch)
+
+            future = loop.create_future()
+            self.batch[discord_id] = future
+            self.memo[discord_id] = future
+
+        # Other callers might be waiting on the same lookup, cancelling one of
+        # them must not cancel it for everyone
+        return await asyncio.shield(future)
+
+    async def load_many(self, discord_ids: Iterable[int]) -> list[Optional[Profile]]:
+        """Find the profiles of multiple discord_ids, in order"""
+
+        return await asyncio.gather(*(self.load(id) for id in discord_ids))
+
+    def clear(self, discord_id: Optional[int] = None):
+        """Forget a remembered lookup, or all of them if no discord_id is given"""
+
+        if discord_id is None:
+            self.memo.clear()
+        else:
+            self.memo.pop(discord_id, None)
+
+    def dispatch(self):
+        """Resolve all lookups requested during the last tick"""
+
+        batch, self.batch = self.batch, {}
+
+        task = asyncio.get_running_loop().create_task(self.fetch(batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def fetch(self, batch: dict[int, asyncio.Future]):
+        try:
+            profiles = await Profile.find_by_discord_ids(batch.keys())
+        except Exception as e:
+            for discord_id, future in batch.items():
+                # Don't remember failures, the next lookup should try again
+                if self.memo.get(discord_id) is future:
+                    del self.memo[discord_id]
+
+                if not future.done():
+                    future.set_exception(e)
+
+            return
+
+        found = {profile.discord_id: profile for profile in profiles}
+        for discord_id, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(discord_id))
+
+
+current_profile_loader: ContextVar[Optional[ProfileLoader]] = ContextVar(
+    "current_profile_loader", default=None
+)
+
+
+def use_profile_loader() -> ProfileLoader:
+    """
+    Give the current task a loader of its own
+
+    discord.py handles every interaction in a task of its own, so lookups are
+    only ever shared between the callers of one interaction. Outside of one,
+    `Profile.find_by_discord_id` queries the database directly.
+    """
+
+    loader = ProfileLoader()
+    current_profile_loader.set(loader)
 
-        return self.email is not None and self.confirmation_code is None
+    return loader
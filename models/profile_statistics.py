@@ -1,22 +1,36 @@
+from datetime import date, datetime, timezone
 from typing import Optional
 from sqlalchemy import (
     Column,
     BigInteger,
+    Date,
     ForeignKey,
     select,
     update,
     Integer,
     func,
+    literal,
+    case,
+    cast,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.engine import Result
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import validates, relationship
 from sqlalchemy.schema import FetchedValue
 
-from models import Base, Model, session_factory
+from models import Base, Model, commit, get_session
 from models.config import Config
 
 
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def utc_today_expr():
+    return cast(func.timezone("utc", func.now()), Date)
+
+
 class ProfileStatistics(Base, Model):
     __tablename__ = "profile_statistics"
 
@@ -30,6 +44,7 @@ class ProfileStatistics(Base, Model):
     freudpoints = Column(Integer, FetchedValue(), nullable=False)
     spendable_freudpoints = Column(Integer, FetchedValue(), nullable=False)
     confession_exposed_count = Column(Integer, FetchedValue(), nullable=False)
+    last_accrued_on = Column(Date, FetchedValue(), nullable=False)
 
     profile = relationship("Profile", foreign_keys=[profile_discord_id])
     config = relationship("Config", foreign_keys=[config_guild_id])
@@ -56,23 +71,9 @@ class ProfileStatistics(Base, Model):
         Creates a new row if there isn't one already
         """
 
-        async with session_factory() as session:
-            result: Result = await session.execute(
-                select(cls).where(
-                    cls.profile_discord_id == discord_id,
-                    cls.config_guild_id == guild_id,
-                )
-            )
-
-            r = result.first()
-            if r is None:
-                new_stats = cls(profile_discord_id=discord_id, config_guild_id=guild_id)
-                session.add(new_stats)
-                await session.commit()
-
-                return new_stats
-
-            return r[0]
+        return await cls.get_or_insert(
+            profile_discord_id=discord_id, config_guild_id=guild_id
+        )
 
     @classmethod
     async def get_all_for_user(cls, discord_id: int) -> list["ProfileStatistics"]:
@@ -80,84 +81,150 @@ class ProfileStatistics(Base, Model):
         Get all profile statistics for a given user
         """
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Result = await session.execute(
                 select(cls).where(cls.profile_discord_id == discord_id)
             )
 
             return result.scalars().all()
 
+    def get_spendable_freudpoints(self, max_spendable: int) -> int:
+        """
+        Get the spendable FreudPoints of a profile, including the ones accrued
+        since they were last spent
+
+        One point accrues every UTC midnight, up to the guilds maximum
+        """
+
+        days = (utc_today() - self.last_accrued_on).days
+        if days <= 0:
+            return self.spendable_freudpoints
+
+        return min(self.spendable_freudpoints + days, max_spendable)
+
     @classmethod
-    async def increment_spendable_freudpoints(cls):
-        """Increment the spendable freudpoints for each profile by 1 up to the max"""
-
-        async with session_factory() as session:
-            max_spendable_subquery = (
-                select(Config.max_spendable_freudpoints)
-                .where(Config.guild_id == cls.config_guild_id)
-                .limit(1)
-                .scalar_subquery()
-            )
+    def spendable_freudpoints_expr(cls):
+        """SQL equivalent of `get_spendable_freudpoints`"""
 
-            await session.execute(
-                update(cls).values(
-                    spendable_freudpoints=func.least(
-                        cls.spendable_freudpoints + 1, max_spendable_subquery
-                    )
-                )
-            )
+        days = utc_today_expr() - cls.last_accrued_on
+        max_spendable = (
+            select(Config.max_spendable_freudpoints)
+            .where(Config.guild_id == cls.config_guild_id)
+            .scalar_subquery()
+        )
 
-            await session.commit()
+        return case(
+            (days <= 0, cls.spendable_freudpoints),
+            else_=func.least(cls.spendable_freudpoints + days, max_spendable),
+        )
 
     @classmethod
-    async def get_freudpoint_top_10(cls, guild_id: int) -> list["ProfileStatistics"]:
-        """Get a top 10 of the members in the given guild with the most freudpoints"""
+    async def transfer(
+        cls, from_id: int, to_id: int, guild_id: int, amount: int
+    ) -> Optional[tuple[int, int]]:
+        """
+        Move spendable FreudPoints from one profile to another profiles
+        FreudPoints in a given guild
+
+        Both profiles get a new row if they don't have one yet, so new members
+        can spend their initial FreudPoint. Returns the new spendable
+        FreudPoints of the awarder and FreudPoints of the awardee, or None if
+        the awarder did not have enough spendable FreudPoints
+        """
+
+        # Accrued points are only materialized when they are spent
+        spendable = cls.spendable_freudpoints_expr()
+        debit = (
+            update(cls)
+            .where(
+                cls.profile_discord_id == from_id,
+                cls.config_guild_id == guild_id,
+                spendable >= amount,
+            )
+            .values(
+                spendable_freudpoints=spendable - amount,
+                last_accrued_on=utc_today_expr(),
+            )
+            .returning(cls.spendable_freudpoints)
+            .cte("debit")
+        )
+
+        credit_insert = insert(cls).from_select(
+            ["profile_discord_id", "config_guild_id", "freudpoints"],
+            select(
+                literal(to_id, BigInteger),
+                literal(guild_id, BigInteger),
+                literal(amount, Integer),
+            ).select_from(debit),
+        )
+        credit = (
+            credit_insert.on_conflict_do_update(
+                index_elements=[cls.profile_discord_id, cls.config_guild_id],
+                set_={
+                    "freudpoints": cls.freudpoints + credit_insert.excluded.freudpoints
+                },
+            )
+            .returning(cls.freudpoints)
+            .cte("credit")
+        )
+
+        async with get_session() as session:
+            # Rows inserted by a CTE aren't visible to the other CTEs of the
+            # same statement, the awarder's row has to exist beforehand
+            await session.execute(
+                insert(cls)
+                .values(profile_discord_id=from_id, config_guild_id=guild_id)
+                .on_conflict_do_nothing()
+            )
 
-        async with session_factory() as session:
             result: Result = await session.execute(
-                select(cls)
-                .where(cls.config_guild_id == guild_id)
-                .order_by(cls.freudpoints.desc())
-                .limit(10)
+                select(debit.c.spendable_freudpoints, credit.c.freudpoints)
             )
 
-        return result.scalars().all()
+            r = result.first()
+            await commit(session)
+
+        if r is None:
+            return None
+
+        return (r[0], r[1])
 
     @classmethod
-    async def increment_exposed_count(cls, discord_id: int, guild_id: int):
-        """Increment the confession exposed count for a profile in a given server"""
+    async def increment_exposed_count(cls, discord_id: int, guild_id: int) -> int:
+        """
+        Increment the confession exposed count for a profile in a given server
+
+        Returns the new count
+        """
+
+        stmt = insert(cls).values(
+            profile_discord_id=discord_id,
+            config_guild_id=guild_id,
+            confession_exposed_count=1,
+        )
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Result = await session.execute(
-                update(cls)
-                .where(
-                    cls.profile_discord_id == discord_id,
-                    cls.config_guild_id == guild_id,
-                )
-                .values(confession_exposed_count=cls.confession_exposed_count + 1)
-                .returning(cls)
+                stmt.on_conflict_do_update(
+                    index_elements=[cls.profile_discord_id, cls.config_guild_id],
+                    set_={"confession_exposed_count": cls.confession_exposed_count + 1},
+                ).returning(cls.confession_exposed_count)
             )
 
-            if len(result.scalars().all()) == 0:
-                new_stats = cls(
-                    profile_discord_id=discord_id,
-                    config_guild_id=guild_id,
-                    confession_exposed_count=1,
-                )
-                session.add(new_stats)
+            count = result.scalar_one()
+            await commit(session)
 
-            await session.commit()
+            return count
 
     @classmethod
-    async def get_exposed_top_10(cls, guild_id: int) -> list["ProfileStatistics"]:
-        """Get a top 10 of the most exposed users for the given guild"""
+    async def get_scores(cls, guild_id: int, column: str) -> list[tuple[int, int]]:
+        """Get the value of a column for every profile in the given guild"""
 
-        async with session_factory() as session:
+        async with get_session() as session:
             result: Result = await session.execute(
-                select(cls)
-                .where(cls.config_guild_id == guild_id)
-                .order_by(cls.confession_exposed_count.desc())
-                .limit(10)
+                select(cls.profile_discord_id, getattr(cls, column)).where(
+                    cls.config_guild_id == guild_id
+                )
             )
 
-        return result.scalars().all()
+        return result.tuples().all()